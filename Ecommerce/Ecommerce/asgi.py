@@ -5,6 +5,8 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Run with: uvicorn Ecommerce.asgi:application --workers N
 """
 
 import os
@@ -12,5 +14,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Ecommerce.settings')
+os.environ.setdefault('ECOMMERCE_ASYNC_VIEWS', '1')  # route to the async views, see settings.ASYNC_VIEWS
+os.environ['ECOMMERCE_ASGI'] = '1'  # no persistent database connections, see Ecommerce/database.py
 
 application = get_asgi_application()
@@ -0,0 +1,66 @@
+# SQLite connection profiles, selected per environment with ECOMMERCE_DB_PROFILE.
+#
+# development: the defaults plus a busy timeout and BEGIN IMMEDIATE, so concurrent writes
+#              queue up instead of failing with "database is locked". Leaves the journal
+#              mode of db.sqlite3 alone.
+# production:  additionally WAL (readers never block the writer), synchronous=NORMAL
+#              (no fsync per commit, still safe with WAL), a 256 MB mmap, a 64 MB page
+#              cache and connections kept open between requests.
+#
+# The PRAGMAs run on every new connection through the backend's init_command.
+#
+# Served over ASGI (Ecommerce/asgi.py sets ECOMMERCE_ASGI=1) connections are never kept:
+# the ORM then runs in a thread pool, where Django doesn't close or reuse persistent
+# connections reliably, so CONN_MAX_AGE is forced to 0 whatever the profile says.
+
+PRODUCTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',  # negative = KiB
+    'PRAGMA temp_store=MEMORY',
+)
+
+PROFILES = {
+    'development': {
+        'OPTIONS': {
+            'timeout': 20,  # seconds; sets SQLite's busy_timeout
+            # Take the write lock when the transaction starts. A deferred transaction that
+            # reads first and writes later fails at once when another writer got in between,
+            # whatever the timeout.
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(PRODUCTION_PRAGMAS),
+        },
+    },
+}
+
+
+def sqlite(name, profile='development', asgi=False):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile {profile!r}, use one of: {', '.join(PROFILES)}")
+    settings = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    apply_profile(settings, profile)
+    if asgi:
+        settings['CONN_MAX_AGE'] = 0
+        settings['CONN_HEALTH_CHECKS'] = False
+    return settings
+
+
+def apply_profile(settings, profile):
+    # Also used by the benchmarks to switch an existing connection's settings
+    values = PROFILES[profile]
+    settings['CONN_MAX_AGE'] = values.get('CONN_MAX_AGE', 0)
+    settings['CONN_HEALTH_CHECKS'] = values.get('CONN_HEALTH_CHECKS', False)
+    settings['OPTIONS'] = dict(values['OPTIONS'])
+    return settings
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-import os
+import os, sys, tempfile
+
+from . import database
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,7 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'base.middleware.StaticFilesMiddleware',  # WhiteNoise, async-capable
+    'base.middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +58,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Sessions live in a signed cookie: no django_session read or write per request, logins and
+# guest carts (order/guestcart.py) included. The data is readable by the client (signed, not
+# encrypted) and limited to ~4 KB, and a logout can't revoke a copied cookie before it expires.
+# For server-side sessions use 'django.contrib.sessions.backends.cached_db' (reads from the cache).
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+# Query count / DB time per request in the Server-Timing header and at /debug/queries/
+QUERY_INSTRUMENTATION = True
+
 ROOT_URLCONF = 'Ecommerce.urls'
 
 TEMPLATES = [
@@ -73,22 +85,67 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'order.context_processor.cart_count',
+                'base.context_processor.categories',
             ],
         },
     },
 ]
 
+# Async counterparts of the context processors above, awaited by the async views before
+# rendering (see base/context_processor.py). The sync ones stay lazy, so nothing they
+# would compute with a blocking query is evaluated inside the event loop.
+ASYNC_CONTEXT_PROCESSORS = [
+    'order.context_processor.acart_count',
+    'base.context_processor.acategories',
+]
+
+# The catalog, cart and order-status pages have async variants (ahome, aview_cart, ...).
+# Ecommerce/asgi.py turns them on; under WSGI the sync views are used, since an async
+# view there would need an event loop per request.
+ASYNC_VIEWS = os.environ.get('ECOMMERCE_ASYNC_VIEWS', '0') == '1'
+
 WSGI_APPLICATION = 'Ecommerce.wsgi.application'
 
+ASGI_APPLICATION = 'Ecommerce.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# Connection profiles are in Ecommerce/database.py; set ECOMMERCE_DB_PROFILE=production when deploying.
 
 DATABASES = {
+    'default': database.sqlite(BASE_DIR / 'db.sqlite3', os.environ.get('ECOMMERCE_DB_PROFILE', 'development'),
+                               asgi=os.environ.get('ECOMMERCE_ASGI') == '1'),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Holds the cart badge counts; use a shared backend (file/redis) when running several workers.
+
+# 'pages' holds the rendered catalog pages and product cards (base/pagecache.py). LocMemCache
+# evicts the least recently used entries past MAX_ENTRIES; each worker keeps its own copies.
+
+# 'catalog' holds the catalog version those entries are keyed by. Every worker must see a
+# bump at once, or the workers that didn't handle a product edit keep serving the old pages:
+# files shared by all the processes of the host (or redis when the workers span hosts).
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce-pages',
+        'TIMEOUT': 60 * 10,
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 10},
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'ecommerce-catalog'),
+        'TIMEOUT': None,
+    },
 }
 
 
@@ -110,6 +167,15 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Passwords use Django's default PBKDF2 everywhere except under the test runner, where MD5
+# makes every created user and login cost microseconds instead of a few hundred ms.
+# (bench_login compares the hashers.)
+if sys.argv[1:2] == ['test']:
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    # The concurrency tests check out from several threads: SQLite's shared in-memory test
+    # database answers them with "table is locked" instead of waiting, a file doesn't
+    DATABASES['default']['TEST'] = {'NAME': os.path.join(tempfile.gettempdir(), 'ecommerce-test.sqlite3')}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -134,7 +200,21 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'base/media')
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Processes that make the WebP/JPEG variants of uploaded images (0 = inline), see base/images.py
+IMAGE_VARIANT_WORKERS = 2
+
+# Uploads get content-hashed names so base/mediafiles.py can cache them forever.
+# (The old STATICFILES_STORAGE setting is ignored since Django 5.1; static files are plain.)
+STORAGES = {
+    'default': {'BACKEND': 'base.storage.HashedMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Media served by base/mediafiles.py: cache lifetime of files without a content hash,
+# and None / 'x-accel-redirect' (nginx, internal location at MEDIA_ACCEL_PREFIX) / 'x-sendfile' (Apache)
+MEDIA_MAX_AGE = 60 * 60
+MEDIA_OFFLOAD = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -142,3 +222,6 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'base.Customer'
+
+# Email or username in one query (base/backends.py)
+AUTHENTICATION_BACKENDS = ['base.backends.EmailOrUsernameBackend']
@@ -1,9 +1,77 @@
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import Q
+from base import pagecache, search
 from base.models import *
+from base.sampling import product_sampler
 
 # Register your models here.
 
-admin.site.register(Product)
-admin.site.register(Category)
-admin.site.register(Customer)
+# The product and customer tables are big: no full count(*) under the result count, no
+# dropdowns with every row (raw id inputs instead), and searches that hit an index.
+ACTION_CHUNK = 1000
 
+
+def update_products(queryset, **values):
+    # Set-based product changes for the actions below. The ids are read first: the update may
+    # take the products out of the changelist's filter (e.g. "active: yes").
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), ACTION_CHUNK):
+        chunk = Product.objects.filter(pk__in=ids[start:start + ACTION_CHUNK])
+        with transaction.atomic():
+            chunk.update(**values)
+            if 'is_active' in values:
+                search.reindex_products(chunk)
+    # update() skips the Product signals
+    if ids:
+        product_sampler.invalidate()
+        pagecache.bump_version()
+    return len(ids)
+
+
+def product_action(description, **values):
+    @admin.action(description=description, permissions=['change'])
+    def action(modeladmin, request, queryset):
+        count = update_products(queryset, **values)
+        modeladmin.message_user(request, f'{count} products updated.')
+    action.__name__ = 'set_' + '_'.join(f'{field}_{value}'.lower() for field, value in values.items())
+    return action
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ['name', 'sku', 'category', 'price', 'stock', 'is_active', 'on_trend']
+    list_select_related = ['category']
+    list_filter = ['is_active', 'on_trend']
+    search_fields = ['sku__exact', 'name']  # other databases; see get_search_results
+    autocomplete_fields = ['category']
+    show_full_result_count = False
+    actions = [
+        product_action('Activate selected products', is_active=True),
+        product_action('Deactivate selected products', is_active=False),
+        product_action('Mark selected products as on trend', on_trend=True),
+        product_action('Unmark selected products as on trend', on_trend=False),
+    ]
+
+    def get_search_results(self, request, queryset, search_term):
+        # The storefront's full-text index instead of a LIKE '%...%' scan over every product;
+        # it only holds active products, inactive ones are found by their sku
+        matches = search.matches(search_term) if search.is_enabled() else None
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(Q(pk__in=matches) | Q(sku=search_term.strip())), False
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    ordering = ['name']
+    search_fields = ['name']  # a few dozen rows; also what the product form's autocomplete uses
+
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ['email', 'username', 'first_name', 'last_name', 'is_staff', 'is_active']
+    list_filter = ['is_staff', 'is_active']
+    search_fields = ['email__exact', 'username__exact']  # the unique indexes
+    show_full_result_count = False
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+
+UserModel = get_user_model()
+
+
+# Log in with the email or the username.
+# Both columns are unique, so one query with an OR over the two indexes finds the user;
+# the login form used to look the user up itself and ModelBackend then did it again.
+# Like ModelBackend, an unknown identifier still runs the password hasher once, so the
+# response takes as long as a wrong password and doesn't tell which accounts exist.
+
+class EmailOrUsernameBackend(ModelBackend):
+    @staticmethod
+    def candidates(identifier):
+        # At most two rows: someone's username can be someone else's email
+        return UserModel._default_manager.filter(Q(email=identifier) | Q(username=identifier))[:2]
+
+    @staticmethod
+    def pick(users, identifier):
+        # The email wins, it's what the account was registered with
+        users = sorted(users, key=lambda user: user.email != identifier)
+        return users[0] if users else None
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        user = self.pick(self.candidates(username), username)
+        if user is None:
+            UserModel().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        user = self.pick([user async for user in self.candidates(username)], username)
+        if user is None:
+            UserModel().set_password(password)
+        elif await user.acheck_password(password) and self.user_can_authenticate(user):
+            return user
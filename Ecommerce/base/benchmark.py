@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+import statistics, tempfile, time, warnings
+
+from django.db import connection
+from django.test.utils import override_settings
+
+
+# Helpers shared by the bench_* management commands.
+# Benchmarks never touch db.sqlite3: they run against a throwaway test database,
+# with DEBUG off so queries aren't logged (and timed) like in development.
+# Pass a file path when several threads or processes need to share the database
+# (the default SQLite test database lives in memory).
+# Uploads and image variants go to a temporary MEDIA_ROOT, made inline.
+@contextmanager
+def test_database(verbosity=0, path=None):
+    settings_dict = connection.settings_dict
+    old_name, old_test_name = settings_dict['NAME'], settings_dict['TEST'].get('NAME')
+    if path:
+        settings_dict['TEST']['NAME'] = str(path)
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(DEBUG=False, MEDIA_ROOT=media_root, IMAGE_VARIANT_WORKERS=0), \
+                warnings.catch_warnings():
+            # WhiteNoise warns about the missing STATIC_ROOT once DEBUG is off
+            warnings.filterwarnings('ignore', message='No directory at')
+            yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        settings_dict['TEST']['NAME'] = old_test_name
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summary(timings):
+    return {
+        'count': len(timings),
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+    }
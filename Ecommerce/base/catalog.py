@@ -0,0 +1,178 @@
+import csv, json, os
+from decimal import Decimal, InvalidOperation
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import search
+from .models import Category, Product
+
+
+# Bulk catalog import (the import_catalog command).
+# Rows are read one at a time from a CSV or JSON-lines file and upserted in chunks: one
+# INSERT ... ON CONFLICT (sku) DO UPDATE per chunk instead of a save() and its signals per
+# product. The chunk's search index rows are rewritten in the same transaction; the sampler
+# and the page cache are refreshed once at the end.
+# Products are matched on the sku column, which every file must have: matching on the name
+# would merge different products that happen to share one.
+REQUIRED = ('sku', 'name', 'price', 'stock', 'category')
+TRUE = {'1', 'true', 'yes', 'y'}
+FALSE = {'0', 'false', 'no', 'n', ''}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(f):
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, RowError(f'invalid JSON: {error}')
+            continue
+        yield number, row if isinstance(row, dict) else RowError('not a JSON object')
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def _text(row, column, max_length=None):
+    value = row.get(column)
+    value = '' if value is None else str(value).strip()
+    if max_length and len(value) > max_length:
+        raise RowError(f'{column} is longer than {max_length} characters')
+    return value
+
+
+def _flag(row, column, default):
+    value = row.get(column)
+    if value is None or isinstance(value, bool):
+        return default if value is None else value
+    value = str(value).strip().lower()
+    if value not in TRUE | FALSE:
+        raise RowError(f'{column} is not a yes/no value: {value!r}')
+    return value in TRUE
+
+
+class CatalogImport:
+    def __init__(self, columns, image_dir, dry_run=False):
+        missing = [column for column in REQUIRED if column not in columns]
+        if missing:
+            raise RowError(f"missing columns: {', '.join(missing)}")
+        self.columns = set(columns)
+        self.image_dir = image_dir
+        self.dry_run = dry_run
+        # Values of the optional columns the file doesn't have are left alone on update
+        self.update_fields = ['name', 'description', 'price', 'stock', 'category'] + [
+            column for column in ('image', 'on_trend', 'is_active') if column in self.columns
+        ]
+        # The lookup pass: every category once, the oldest one wins if a name is repeated
+        self.categories = dict(Category.objects.order_by('-pk').values_list('name', 'pk'))
+        self.new_categories = set()
+        self.images = {}
+        self.seen = set()  # dry run: what the skipped writes would have created
+        self.created = self.updated = 0
+
+    def product(self, row):
+        name = _text(row, 'name', 255)
+        if not name:
+            raise RowError('name is empty')
+        sku = _text(row, 'sku', 255)
+        if not sku:
+            raise RowError('sku is empty')
+        try:
+            price = Decimal(_text(row, 'price'))
+            stock = int(_text(row, 'stock'))
+        except (InvalidOperation, ValueError):
+            raise RowError(f"bad price or stock: {row.get('price')!r}, {row.get('stock')!r}")
+        if not price.is_finite() or price < 0 or price.as_tuple().exponent < -2 or price >= 10 ** 8:
+            raise RowError(f'bad price: {price}')
+        if stock < 0:
+            raise RowError(f'negative stock: {stock}')
+        category = _text(row, 'category', 100)
+        if not category:
+            raise RowError('category is empty')
+
+        product = Product(sku=sku, name=name, description=_text(row, 'description'), price=price, stock=stock,
+                          on_trend=_flag(row, 'on_trend', False), is_active=_flag(row, 'is_active', True))
+        product.category_name = category
+        if 'image' in self.columns:
+            product.image = self.image(_text(row, 'image'))
+        return product
+
+    def image(self, path):
+        # A local file is copied into the media storage once per run; the hashed storage
+        # reuses the stored copy when the same picture is imported again. A path that only
+        # exists in the storage (an exported image name) is kept as it is.
+        if not path:
+            return ''
+        if path not in self.images:
+            local = os.path.join(self.image_dir, path)
+            if os.path.isfile(local):
+                if self.dry_run:
+                    name = path
+                else:
+                    field = Product._meta.get_field('image')
+                    with open(local, 'rb') as f:
+                        name = default_storage.save(field.generate_filename(None, os.path.basename(local)), File(f))
+            elif default_storage.exists(path):
+                name = path
+            else:
+                raise RowError(f'image not found: {path}')
+            self.images[path] = name
+        return self.images[path]
+
+    def resolve_categories(self, products):
+        missing = sorted({p.category_name for p in products} - self.categories.keys())
+        if missing and self.dry_run:
+            self.new_categories.update(missing)
+            self.categories.update((name, None) for name in missing)
+        elif missing:
+            for category in Category.objects.bulk_create([Category(name=name) for name in missing]):
+                self.categories[category.name] = category.pk
+            self.new_categories.update(missing)
+        for product in products:
+            product.category_id = self.categories[product.category_name]
+
+    def write(self, products):
+        from order.models import CartItem, ShoppingCart  # order imports base
+
+        # A product listed twice in a chunk: the last row wins
+        products = list({product.sku: product for product in products}.values())
+        keys = [product.sku for product in products]
+        prices = dict(Product.objects.filter(sku__in=keys).values_list('sku', 'price'))
+        existing = set(prices)
+        self.resolve_categories(products)
+        if self.dry_run:
+            existing.update(self.seen.intersection(keys))
+            self.seen.update(keys)
+        else:
+            Product.objects.bulk_create(products, update_conflicts=True, unique_fields=['sku'],
+                                        update_fields=self.update_fields)
+            search.reindex_products(Product.objects.filter(sku__in=keys))
+            # The upsert skips the Product signals: recompute the cached subtotal of the
+            # carts holding a product whose price changed, in the same transaction
+            repriced = [product.sku for product in products
+                        if product.sku in prices and prices[product.sku] != product.price]
+            if repriced:
+                ShoppingCart.update_subtotals(CartItem.objects.filter(product__sku__in=repriced).values('cart'))
+        self.updated += len(existing)
+        self.created += len(products) - len(existing)
+
+    def write_chunk(self, products, atomic):
+        if atomic or self.dry_run:
+            self.write(products)
+        else:
+            # Short transactions: other writers only wait for one chunk at a time
+            with transaction.atomic():
+                self.write(products)
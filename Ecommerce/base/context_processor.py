@@ -0,0 +1,61 @@
+from functools import cache
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+from .models import Category
+from . import pagecache
+
+
+def _navigation_queryset():
+    return (Category.objects.annotate(product_count=Count('products', filter=Q(products__is_active=True)))
+            .order_by('name')
+            .values('id', 'name', 'product_count'))
+
+
+def navigation_categories():
+    # Cached under the catalog version, so any Product/Category save or delete refreshes it
+    key = pagecache.make_key('nav', pagecache.catalog_version())
+    categories = pagecache.get('nav', key)
+    if categories is None:
+        categories = list(_navigation_queryset())
+        pagecache.page_cache().set(key, categories)
+    return categories
+
+
+async def anavigation_categories():
+    key = pagecache.make_key('nav', await pagecache.acatalog_version())
+    categories = await pagecache.aget('nav', key)
+    if categories is None:
+        categories = [category async for category in _navigation_queryset()]
+        await pagecache.page_cache().aset(key, categories)
+    return categories
+
+
+def categories(request):
+    # Categories for the navbar on every page, with their number of active products.
+    # Lazy: pages that don't show the menu never touch the cache or the database.
+    return {'categories': SimpleLazyObject(navigation_categories)}
+
+
+async def acategories(request):
+    return {'categories': await anavigation_categories()}
+
+
+@cache
+def async_processors():
+    return [import_string(path) for path in settings.ASYNC_CONTEXT_PROCESSORS]
+
+
+async def acontext(request):
+    # What the async views pass to the template on top of their own context.
+    # Template context processors are called synchronously while rendering; the view's own
+    # values take precedence over theirs, so with these filled in the lazy sync ones are
+    # never evaluated. request.user is resolved here too: loading it also loads the session,
+    # which the messages processor reads.
+    request.user = await request.auser()
+    context = {}
+    for processor in async_processors():
+        context.update(await processor(request))
+    return context
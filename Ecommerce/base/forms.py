@@ -1,6 +1,5 @@
 from django import forms
 from .models import *
-from django.db.models import Q
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 
 
@@ -41,14 +40,12 @@ class UserAuthenticationForm(AuthenticationForm):
         'placeholder':'Password',
     }))
 
-    def clean_username(self):
-        username = self.cleaned_data['username']
-        try:
-            user = Customer.objects.get(Q(email=username) | Q(username=username))
-        except Customer.DoesNotExist:
-            raise forms.ValidationError('No user found with this email or username')
-        
-        return user.email 
+    # The email or username is resolved by base.backends.EmailOrUsernameBackend; the same
+    # message for an unknown account and a wrong password, so neither gives accounts away
+    error_messages = {
+        **AuthenticationForm.error_messages,
+        'invalid_login': 'Please enter a correct email or username and password.',
+    }
 
 class EditProfileForm(forms.ModelForm):
     first_name = forms.CharField(label='',widget=forms.TextInput(attrs={
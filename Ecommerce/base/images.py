@@ -0,0 +1,140 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing, os, posixpath, threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .storage import is_hashed
+
+
+# Responsive variants of Product.image and Category.image.
+# Every image gets resized copies next to MEDIA_ROOT/images/variants/ at the widths
+# below (never wider than the original), once as WebP and once as JPEG:
+#   images/products/shoe.png -> images/variants/products/shoe-320w.webp, shoe-320w.jpg, ...
+# What was made is stored on the row itself (image_variants), so templates build the
+# srcset without touching the disk, see base/templatetags/responsive_images.py.
+WIDTHS = (160, 320, 640, 960)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+VARIANT_DIR = 'images/variants'
+
+
+def variant_name(name, width, fmt):
+    # images/products/shoe.png -> images/variants/products/shoe-320w.webp
+    # A content hash stays last (shoe.3f2a9c1b4d5e.png -> shoe-320w.3f2a9c1b4d5e.webp) so
+    # the variants are cached as immutable like the original
+    folder, filename = posixpath.split(name)
+    stem, digest = posixpath.splitext(filename)[0], ''
+    if is_hashed(filename):
+        stem, digest = stem.rsplit('.', 1)
+        digest = '.' + digest
+    folder = folder[len('images/'):] if folder.startswith('images/') else folder
+    return posixpath.join(VARIANT_DIR, folder, f'{stem}-{width}w{digest}.{EXTENSIONS[fmt]}')
+
+
+def target_widths(width):
+    # Every configured width below the original, plus one copy at (at most) the largest width
+    widths = [w for w in WIDTHS if w < width]
+    widths.append(min(width, WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def render_variants(media_root, name):
+    # Runs in the worker processes: only Pillow and the filesystem, no models or settings.
+    # Returns the manifest saved in image_variants.
+    source = os.path.join(media_root, name)
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ('RGBA', 'LA') or (original.mode == 'P' and 'transparency' in original.info)
+        image = original.convert('RGBA' if has_alpha else 'RGB')
+
+    manifest = {
+        'source': name,
+        'width': image.width,
+        'height': image.height,
+        'original_bytes': os.path.getsize(source),
+    }
+    for width in target_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt, (pil_format, options) in FORMATS.items():
+            frame = resized
+            if pil_format == 'JPEG' and frame.mode == 'RGBA':
+                # JPEG has no transparency: flatten onto white like the pages' background
+                frame = Image.new('RGB', resized.size, 'white')
+                frame.paste(resized, mask=resized.getchannel('A'))
+            out = variant_name(name, width, fmt)
+            path = os.path.join(media_root, out)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            frame.save(path, pil_format, **options)
+            manifest.setdefault(fmt, []).append([width, out, os.path.getsize(path)])
+    return manifest
+
+
+def needs_variants(instance):
+    variants = instance.image_variants or {}
+    if not instance.image:
+        return bool(variants)
+    return variants.get('source') != instance.image.name
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Lazily started, shared by the upload signals. Spawned rather than forked so the
+    # workers don't inherit the web process's threads and database connections.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _store(model, pk, name, manifest):
+    try:
+        # Only if the image wasn't replaced again while the variants were being made
+        if model._default_manager.filter(pk=pk, image=name).update(image_variants=manifest):
+            from . import pagecache  # not at the top: the spawned workers import this module
+            pagecache.bump_version()
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(instance):
+    # Called from post_save: (re)build the variants of a new or replaced image.
+    # With IMAGE_VARIANT_WORKERS = 0 they are made inline, before the request returns.
+    # A missing or unreadable file just leaves the row without variants (the original is served).
+    if not needs_variants(instance):
+        return
+    model = type(instance)
+    if not instance.image:
+        model._default_manager.filter(pk=instance.pk).update(image_variants={})
+        return
+
+    name = instance.image.name
+    if not getattr(settings, 'IMAGE_VARIANT_WORKERS', 2):
+        try:
+            manifest = render_variants(settings.MEDIA_ROOT, name)
+        except OSError:
+            return
+        model._default_manager.filter(pk=instance.pk).update(image_variants=manifest)
+        instance.image_variants = manifest
+        return
+
+    def submit():
+        future = get_pool().submit(render_variants, settings.MEDIA_ROOT, name)
+        future.add_done_callback(
+            lambda future: future.exception() is None and _store(model, instance.pk, name, future.result())
+        )
+
+    # After the commit, or the worker's UPDATE could run before the new image is visible
+    transaction.on_commit(submit)
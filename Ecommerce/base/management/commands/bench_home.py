@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from base.benchmark import test_database, timed, summary
+from base.pagecache import page_cache
+from base.models import Category, Product
+from base.sampling import product_sampler
+
+
+class Command(BaseCommand):
+    help = 'Measure home page latency for growing catalog sizes (runs on a throwaway test database).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000, 1000000])
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with test_database():
+            category = Category.objects.create(name='Bench', image='images/logo/nike_PNG11.png')
+            client = Client()
+            url = reverse('home')
+            created = 0
+
+            self.stdout.write(f"{'products':>10} {'cache':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+            for size in sorted(options['sizes']):
+                created = self.fill(category, created, size, options['batch_size'])
+                product_sampler.invalidate()
+                page_cache().clear()
+                client.get(url)  # warm the sampler index
+
+                def uncached():
+                    page_cache().clear()
+                    client.get(url)
+
+                for label, request in (('off', uncached), ('on', lambda: client.get(url))):
+                    result = summary(timed(request, options['requests']))
+                    self.stdout.write(
+                        f"{size:>10} {label:<8} {result['mean_ms']:>9.2f} {result['p50_ms']:>9.2f} "
+                        f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+                    )
+
+    def fill(self, category, created, size, batch_size):
+        with transaction.atomic():
+            while created < size:
+                count = min(batch_size, size - created)
+                Product.objects.bulk_create([
+                    Product(
+                        name=f'Bench Product {created + i}',
+                        description='Benchmark product',
+                        price=100,
+                        stock=10,
+                        image='images/products/AIRJORDAN11RETROLOW.png',
+                        category=category,
+                    )
+                    for i in range(count)
+                ])
+                created += count
+        return created
@@ -0,0 +1,89 @@
+from importlib.util import find_spec
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from base.benchmark import test_database, summary
+from base.models import Customer
+
+PASSWORD = 'bench-password'
+
+# name -> (hasher, module it needs)
+HASHERS = {
+    'pbkdf2': ('django.contrib.auth.hashers.PBKDF2PasswordHasher', None),
+    'pbkdf2_sha1': ('django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher', None),
+    'scrypt': ('django.contrib.auth.hashers.ScryptPasswordHasher', None),
+    'argon2': ('django.contrib.auth.hashers.Argon2PasswordHasher', 'argon2'),
+    'bcrypt': ('django.contrib.auth.hashers.BCryptSHA256PasswordHasher', 'bcrypt'),
+    'md5': ('django.contrib.auth.hashers.MD5PasswordHasher', None),  # the test runner's, see settings
+}
+
+
+class Command(BaseCommand):
+    help = ('Login throughput through the login form for each password hasher, with the queries per '
+            'login and the response time of wrong passwords and unknown accounts (runs on a throwaway '
+            'test database).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20, help='Attempts per hasher and case.')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--hashers', nargs='+', default=[name for name, (_, module) in HASHERS.items()
+                                                             if module is None or find_spec(module)])
+
+    def handle(self, *args, **options):
+        unknown = set(options['hashers']) - set(HASHERS)
+        if unknown:
+            raise CommandError(f"Unknown hashers: {', '.join(sorted(unknown))}")
+
+        with test_database():
+            users = Customer.objects.bulk_create([
+                Customer(email=f'bench{i}@example.com', username=f'bench{i}', password='!')
+                for i in range(options['users'])
+            ])
+            self.queries = 0
+            with connection.execute_wrapper(self.count):
+                self.stdout.write(
+                    f"{'hasher':<12} {'logins/s':>9} {'queries':>8} {'ok ms':>8} {'wrong ms':>9} {'unknown ms':>11}"
+                )
+                for name in options['hashers']:
+                    self.run(name, users, options['logins'])
+
+    def count(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def login(self, identifier, password, expect_success):
+        client = Client()
+        self.queries = 0
+        start = time.perf_counter()
+        response = client.post(reverse('login'), {'username': identifier, 'password': password})
+        elapsed = time.perf_counter() - start
+        if (response.status_code == 302) != expect_success:
+            raise CommandError(f'Unexpected login result for {identifier}: {response.status_code}')
+        return elapsed, self.queries
+
+    def run(self, name, users, logins):
+        hasher = HASHERS[name][0]
+        with override_settings(PASSWORD_HASHERS=[hasher]):
+            # One hash for everybody; stored with the hasher under test so nothing gets upgraded
+            Customer.objects.update(password=make_password(PASSWORD))
+
+            ok, queries = [], []
+            for i in range(logins):
+                user = users[i % len(users)]
+                # Alternate the two identifiers the login form accepts
+                elapsed, count = self.login(user.email if i % 2 else user.username, PASSWORD, True)
+                ok.append(elapsed)
+                queries.append(count)
+            wrong = [self.login(users[i % len(users)].email, 'not-the-password', False)[0] for i in range(logins)]
+            missing = [self.login(f'nobody{i}@example.com', PASSWORD, False)[0] for i in range(logins)]
+
+        self.stdout.write(
+            f"{name:<12} {len(ok) / sum(ok):>9.1f} {sum(queries) / len(queries):>8.1f} "
+            f"{summary(ok)['p50_ms']:>8.2f} {summary(wrong)['p50_ms']:>9.2f} {summary(missing)['p50_ms']:>11.2f}"
+        )
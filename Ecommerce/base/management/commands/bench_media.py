@@ -0,0 +1,57 @@
+import os, tempfile
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.views import static
+
+from base import mediafiles
+from base.benchmark import timed, summary
+
+
+class Command(BaseCommand):
+    help = ('Compare serving a media file through django.views.static.serve (the DEBUG-only path) '
+            'and base.mediafiles.serve: full download, revalidation and a range request.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=512 * 1024, help='Size of the test file in bytes.')
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            name = 'images/products/bench.0123456789ab.png'
+            os.makedirs(os.path.join(media_root, 'images/products'))
+            with open(os.path.join(media_root, name), 'wb') as f:
+                f.write(os.urandom(options['size']))
+
+            first = mediafiles.serve(factory.get('/media/' + name), name)
+            etag, last_modified = first['ETag'], first['Last-Modified']
+            first.close()
+
+            views = {
+                'static.serve': lambda request: static.serve(request, name, document_root=media_root),
+                'mediafiles.serve': lambda request: mediafiles.serve(request, name),
+            }
+            scenarios = {
+                'full GET': {},
+                'revalidate': {'HTTP_IF_NONE_MATCH': etag, 'HTTP_IF_MODIFIED_SINCE': last_modified},
+                'range 64KiB': {'HTTP_RANGE': 'bytes=0-65535'},
+            }
+
+            self.stdout.write(f"{'view':<18} {'scenario':<12} {'status':>6} {'bytes':>9} {'mean ms':>9} {'p95 ms':>9}  cache-control")
+            for scenario, headers in scenarios.items():
+                for label, view in views.items():
+                    def request():
+                        response = view(factory.get('/media/' + name, **headers))
+                        body = b''.join(response) if response.streaming else response.content
+                        response.close()
+                        return response, body
+
+                    response, body = request()
+                    result = summary(timed(request, options['requests']))
+                    self.stdout.write(
+                        f"{label:<18} {scenario:<12} {response.status_code:>6} {len(body):>9} "
+                        f"{result['mean_ms']:>9.3f} {result['p95_ms']:>9.3f}  {response.get('Cache-Control', '-')}"
+                    )
+            self.stdout.write('An immutable Cache-Control means browsers skip even the revalidation request '
+                              'for content-hashed names until max-age runs out.')
@@ -0,0 +1,53 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base import search
+from base.benchmark import test_database, timed, summary
+from base.models import Category, Product
+
+BRANDS = ['Nike', 'Adidas', 'Puma', 'Reebok', 'Fila', 'Skechers', 'Jordan', 'Asics', 'Vans', 'Converse']
+MODELS = ['Air', 'Max', 'Runner', 'Classic', 'Retro', 'Zoom', 'Court', 'Trail', 'Boost', 'Low', 'High', 'Pro']
+COLORS = ['Black', 'White', 'Red', 'Blue', 'Green', 'Grey', 'Chocolate', 'Navy', 'Pink', 'Volt']
+WORDS = ['cushioned', 'breathable', 'leather', 'mesh', 'lightweight', 'basketball', 'running',
+         'walking', 'suede', 'waterproof', 'durable', 'rubber', 'outsole', 'comfortable', 'vintage']
+
+QUERIES = ['nike', 'air max', 'jord', 'black leather', 'waterproof trail', 'puma retro red', 'zzz']
+
+
+class Command(BaseCommand):
+    help = 'Measure full-text search latency on a synthetic catalog (runs on a throwaway test database).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=300000)
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with test_database():
+            categories = Category.objects.bulk_create([Category(name=brand) for brand in BRANDS])
+            with transaction.atomic():
+                for start in range(0, options['products'], 5000):
+                    Product.objects.bulk_create([
+                        Product(
+                            name=f'{rng.choice(BRANDS)} {rng.choice(MODELS)} {rng.choice(MODELS)} {rng.choice(COLORS)}',
+                            description=' '.join(rng.choices(WORDS, k=12)),
+                            price=rng.randint(50, 500),
+                            stock=rng.randint(0, 50),
+                            category=rng.choice(categories),
+                        )
+                        for _ in range(min(5000, options['products'] - start))
+                    ])
+            search.rebuild()
+
+            self.stdout.write(f"{options['products']} products")
+            self.stdout.write(f"{'query':<20} {'page':>4} {'mean ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+            for query in QUERIES:
+                for page in (1, 10):
+                    result = summary(timed(lambda: search.search(query, page=page), options['requests']))
+                    self.stdout.write(
+                        f"{query:<20} {page:>4} {result['mean_ms']:>9.2f} "
+                        f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+                    )
@@ -0,0 +1,248 @@
+from contextlib import contextmanager
+from importlib import import_module
+from importlib.util import find_spec
+from pathlib import Path
+import asyncio, io, os, random, socket, subprocess, sys, tempfile, time
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.urls import reverse
+
+from Ecommerce.database import apply_profile
+from base.benchmark import test_database, summary
+from base.models import Customer, Product
+from order.models import Order
+
+# name -> (command line, extra environment). {port} and {workers} are filled in.
+SERVERS = {
+    # The usual WSGI deployment: a thread per request in flight
+    'gunicorn': (['-m', 'gunicorn', 'Ecommerce.wsgi:application', '--worker-class', 'gthread',
+                  '--workers', '{workers}', '--threads', '32', '--bind', '127.0.0.1:{port}',
+                  '--log-level', 'warning'], {}),
+    # ASGI with the sync views: shows what the server alone changes
+    'uvicorn-sync': (['-m', 'uvicorn', 'Ecommerce.asgi:application', '--workers', '{workers}',
+                      '--port', '{port}', '--no-access-log', '--log-level', 'warning'],
+                     {'ECOMMERCE_ASYNC_VIEWS': '0'}),
+    'uvicorn': (['-m', 'uvicorn', 'Ecommerce.asgi:application', '--workers', '{workers}',
+                 '--port', '{port}', '--no-access-log', '--log-level', 'warning'], {}),
+}
+REQUIRES = {'gunicorn': 'gunicorn', 'uvicorn-sync': 'uvicorn', 'uvicorn': 'uvicorn'}
+
+SEARCH_TERMS = ['air', 'max', 'runner', 'classic', 'retro low', 'court', 'nike', 'gel']
+
+# Settings of the server processes: the project settings on the benchmark database
+SETTINGS_MODULE = '''
+import warnings
+from Ecommerce.settings import *
+from Ecommerce import database
+
+warnings.filterwarnings('ignore', message='No directory at')  # no collectstatic here
+
+DEBUG = False
+DATABASES = {{'default': database.sqlite({name!r}, 'production')}}
+MEDIA_ROOT = {media_root!r}
+IMAGE_VARIANT_WORKERS = 0
+'''
+
+
+# Catalog and order-status pages under a WSGI server (gunicorn, threads) and an ASGI one
+# (uvicorn), at one or more concurrency levels. Every virtual user holds one keep-alive
+# connection and requests pages back to back; half of them are logged in (their pages
+# aren't served from the page cache). The client is a small asyncio HTTP/1.1 client in this
+# process, so on a small machine it competes with the server for the CPU: compare rows
+# with each other, not with other machines.
+
+class Connection:
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, path, cookie):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        head = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+        if cookie:
+            head += f'Cookie: {cookie}\r\n'
+        self.writer.write(f'{head}\r\n'.encode())
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while size := int((await self.reader.readline()).strip(), 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readline()
+        else:
+            await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = ('Compare a WSGI (gunicorn) and an ASGI (uvicorn) deployment under concurrent load, '
+            'on a throwaway seeded database. Needs gunicorn and uvicorn installed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200])
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds measured per run.')
+        parser.add_argument('--warmup', type=float, default=3.0, help='Seconds before measuring.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        missing = sorted({REQUIRES[name] for name in options['servers'] if find_spec(REQUIRES[name]) is None})
+        if missing:
+            raise CommandError(f"Install {' and '.join(missing)} to run these servers.")
+
+        self.rng = random.Random(options['seed'])
+        users = max(options['concurrency'])
+        with tempfile.TemporaryDirectory() as tmp, test_database(path=Path(tmp) / 'bench_servers.sqlite3'):
+            apply_profile(connection.settings_dict, 'production')
+            connection.close()
+            call_command('seed', products=options['products'], customers=max(users, 200), orders=options['orders'],
+                         seed=options['seed'], stdout=io.StringIO())
+            self.prepare(users)
+            settings_dir = self.write_settings(tmp)
+            connections.close_all()  # the servers open the file themselves
+
+            self.stdout.write(
+                f"{'server':<14} {'conc':>5} {'requests':>9} {'req/s':>8} {'errors':>6} "
+                f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+            )
+            for name in options['servers']:
+                for concurrency in options['concurrency']:
+                    with self.server(name, settings_dir, options['workers']) as port:
+                        result = asyncio.run(self.load(port, concurrency, options['warmup'], options['duration']))
+                    self.print_row(name, concurrency, *result)
+
+    def prepare(self, users):
+        # Sessions made directly in the session store: logging in through the form would
+        # only benchmark the password hasher
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        self.product_ids = list(Product.objects.filter(is_active=True).values_list('id', flat=True))
+        first_order = {}
+        for user_id, order_id in Order.objects.order_by('id').values_list('user_id', 'id'):
+            first_order.setdefault(user_id, order_id)
+
+        self.users = []
+        for index, customer in enumerate(Customer.objects.filter(pk__in=list(first_order))[:users]):
+            if index % 2:
+                self.users.append((None, None))  # anonymous
+                continue
+            session = store()
+            session[SESSION_KEY] = str(customer.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = customer.get_session_auth_hash()
+            session.save()  # creates the row, or computes the signed cookie value
+            self.users.append((f'{settings.SESSION_COOKIE_NAME}={session.session_key}', first_order[customer.pk]))
+        while len(self.users) < users:
+            self.users.append((None, None))
+
+    def write_settings(self, tmp):
+        settings_dir = Path(tmp) / 'settings'
+        settings_dir.mkdir()
+        (settings_dir / 'bench_server_settings.py').write_text(SETTINGS_MODULE.format(
+            name=str(connection.settings_dict['NAME']), media_root=settings.MEDIA_ROOT,
+        ))
+        return settings_dir
+
+    @contextmanager
+    def server(self, name, settings_dir, workers):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        arguments, extra_env = SERVERS[name]
+        arguments = [part.format(port=port, workers=workers) for part in arguments]
+        env = {
+            **os.environ, **extra_env,
+            'DJANGO_SETTINGS_MODULE': 'bench_server_settings',
+            'PYTHONPATH': os.pathsep.join([str(settings_dir), str(settings.BASE_DIR)]),
+        }
+
+        process = subprocess.Popen([sys.executable, *arguments], cwd=settings.BASE_DIR, env=env)
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                if process.poll() is not None:
+                    raise CommandError(f'{name} exited with status {process.returncode}')
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise CommandError(f'{name} did not start listening on port {port}')
+                    time.sleep(0.1)
+            yield port
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def pick_path(self, rng, order_id):
+        # Anonymous: home, product detail, search. Logged in: home, product detail, cart, order status
+        page = rng.randrange(4)
+        if page == 0:
+            return reverse('home')
+        if page == 1:
+            return reverse('product_detail', args=[rng.choice(self.product_ids)])
+        if order_id is None:
+            return f"{reverse('search_product')}?searched={rng.choice(SEARCH_TERMS).replace(' ', '+')}"
+        if page == 2:
+            return reverse('view_cart')
+        return reverse('order_status', args=[order_id])
+
+    async def load(self, port, concurrency, warmup, duration):
+        start = time.perf_counter()
+        measure_from, stop_at = start + warmup, start + warmup + duration
+        latencies, errors = [], [0]
+
+        async def virtual_user(index):
+            rng = random.Random(self.rng.random())
+            cookie, order_id = self.users[index]
+            conn = Connection(port)
+            try:
+                while (now := time.perf_counter()) < stop_at:
+                    path = self.pick_path(rng, order_id)
+                    try:
+                        status = await conn.request(path, cookie)
+                    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                        conn.close()
+                        status = None
+                    elapsed = time.perf_counter() - now
+                    if now >= measure_from:
+                        if status != 200:
+                            errors[0] += 1
+                        else:
+                            latencies.append(elapsed)
+            finally:
+                conn.close()
+
+        await asyncio.gather(*(virtual_user(index) for index in range(concurrency)))
+        return latencies, errors[0], duration
+
+    def print_row(self, name, concurrency, latencies, errors, duration):
+        timing = summary(latencies) if latencies else {'p50_ms': 0, 'p95_ms': 0, 'p99_ms': 0}
+        self.stdout.write(
+            f"{name:<14} {concurrency:>5} {len(latencies):>9} {len(latencies) / duration:>8.1f} {errors:>6} "
+            f"{timing['p50_ms']:>8.2f} {timing['p95_ms']:>8.2f} {timing['p99_ms']:>8.2f}"
+        )
@@ -0,0 +1,350 @@
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from pathlib import Path
+from urllib.parse import quote
+import datetime, json, platform, random, re, subprocess, tempfile, threading, time
+import urllib.error, urllib.request
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from Ecommerce.database import PROFILES, apply_profile
+from base import search
+from base.benchmark import test_database, summary
+from base.models import Address, Category, Customer, Product
+from base.sampling import product_sampler
+from order.models import ShoppingCart
+
+PASSWORD = 'bench-password'
+SEARCH_TERMS = ['air', 'jordan', 'runner', 'classic', 'retro low', 'court']
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+ORDER_SUMMARY = re.compile(r'/order-summary/(\d+)/')
+
+
+# End-to-end storefront benchmark.
+# Worker threads each log in as their own customer and repeat the selected scenarios
+# against a throwaway database, through the Django test client or a real local WSGI
+# server. Every request is recorded under its URL name with its latency and query count.
+
+class ClientTransport:
+    # Django test client in the worker thread; queries are counted on this thread's connection
+    def __init__(self, base_url=None):
+        self.client = Client()
+        self.queries = 0
+        connections['default'].execute_wrappers.append(self.count)
+
+    def count(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def request(self, method, path, data=None):
+        self.queries = 0
+        response = getattr(self.client, method)(path, data or {})
+        return response.status_code, response.get('Location', ''), self.queries
+
+    def close(self):
+        connections['default'].execute_wrappers.remove(self.count)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPTransport:
+    # Real HTTP against the local server; query counts come from QueryCountMiddleware's
+    # Server-Timing header (None when QUERY_INSTRUMENTATION is off)
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def request(self, method, path, data=None):
+        headers = {}
+        body = None
+        if method == 'post':
+            body = urllib.parse.urlencode(data or {}).encode()
+            token = next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+            headers['X-CSRFToken'] = token
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method.upper())
+        try:
+            response = self.opener.open(request)
+        except urllib.error.HTTPError as error:  # 3xx/4xx/5xx
+            response = error
+        with response:
+            response.read()
+            match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+            return response.status, response.headers.get('Location', ''), int(match[1]) if match else None
+
+    def close(self):
+        pass
+
+
+class Session:
+    def __init__(self, transport, samples):
+        self.transport = transport
+        self.samples = samples  # url name -> [(seconds, queries, status)]
+        self.record = True
+
+    def call(self, name, method, path, data=None):
+        start = time.perf_counter()
+        status, location, queries = self.transport.request(method, path, data)
+        elapsed = time.perf_counter() - start
+        if self.record:
+            self.samples[name].append((elapsed, queries, status))
+        return status, location
+
+    def get(self, name, path):
+        return self.call(name, 'get', path)
+
+    def post(self, name, path, data):
+        return self.call(f'{name} POST', 'post', path, data)
+
+
+# Scenarios: one visit each, run in order every iteration
+
+def browse(session, rng, data):
+    session.get('home', reverse('home'))
+    session.get('search_product', reverse('search_product') + '?searched=' + quote(rng.choice(SEARCH_TERMS)))
+    session.get('product_detail', reverse('product_detail', args=[rng.choice(data['product_ids'])]))
+
+
+def shop(session, rng, data):
+    product_id = rng.choice(data['product_ids'])
+    session.get('add_to_cart', reverse('add_to_cart', args=[product_id]) + '?quantity=1')
+    session.get('view_cart', reverse('view_cart'))
+    session.get('checkout_cart', reverse('checkout_cart'))
+    status, location = session.post('checkout_cart', reverse('checkout_cart'), data['checkout_form'](session))
+    match = ORDER_SUMMARY.search(location)
+    if match:
+        session.get('order_summary', reverse('order_summary', args=[match[1]]))
+        session.get('order_status', reverse('order_status', args=[match[1]]))
+        session.get('order_list', reverse('order_list'))
+
+
+SCENARIOS = {'browse': browse, 'shop': shop}
+
+
+class Command(BaseCommand):
+    help = ('End-to-end load benchmark of the storefront: concurrent customers browse, search, add to cart, '
+            'check out and look at their orders. Reports throughput, p50/p95/p99 and queries per URL name '
+            'and can save the results as JSON and compare them with an earlier run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+        parser.add_argument('--concurrency', type=int, default=4, help='Worker threads, one customer each.')
+        parser.add_argument('--iterations', type=int, default=25, help='Scenario rounds per worker.')
+        parser.add_argument('--warmup', type=int, default=2, help='Unrecorded rounds per worker first.')
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--transport', choices=['client', 'http'], default='client',
+                            help='Django test client, or HTTP against a local threaded WSGI server.')
+        parser.add_argument('--db-profile', choices=sorted(PROFILES), default='production')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Fail the comparison when a p95 grows by more than this fraction.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark runs against a throwaway SQLite database.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        rng = random.Random(options['seed'])
+        with tempfile.TemporaryDirectory() as tmp, test_database(path=Path(tmp) / 'benchmark.sqlite3'):
+            apply_profile(connection.settings_dict, options['db_profile'])
+            connection.close()
+            data = self.setup_data(rng, options)
+            connections.close_all()
+
+            server = None
+            base_url = None
+            if options['transport'] == 'http':
+                server, base_url = self.start_server()
+            try:
+                samples, elapsed = self.run(data, base_url, options)
+            finally:
+                if server:
+                    server.shutdown()
+                    server.server_close()
+
+        results = self.results(samples, elapsed, options)
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved to {options['output']}")
+        if baseline:
+            self.compare(baseline, results, options['threshold'])
+
+    def setup_data(self, rng, options):
+        categories = Category.objects.bulk_create([
+            Category(name=name) for name in ('Nike', 'Adidas', 'Puma', 'Fila', 'Reebok')
+        ])
+        words = ['Air', 'Jordan', 'Runner', 'Classic', 'Retro', 'Low', 'High', 'Court', 'Max', 'Zoom']
+        products = Product.objects.bulk_create([
+            Product(
+                name=' '.join(rng.sample(words, 3)) + f' {i}',
+                description='Benchmark product with a ' + ' '.join(rng.sample(words, 4)).lower() + ' look',
+                price=rng.randint(20, 300) * 10,
+                stock=10 ** 6,
+                category=rng.choice(categories),
+                image='images/products/AIRJORDAN11RETROLOW.png',
+            )
+            for i in range(options['products'])
+        ])
+        search.rebuild()
+        product_sampler.invalidate()
+
+        password = make_password(PASSWORD)  # hashed once for every bench customer
+        users = Customer.objects.bulk_create([
+            Customer(email=f'bench{i}@example.com', username=f'bench{i}', first_name='Bench', last_name=str(i),
+                     phone='09170000000', password=password)
+            for i in range(options['concurrency'])
+        ])
+        Address.objects.bulk_create([
+            Address(user=user, street='1 Bench St', city='Bench City', postal='1000') for user in users
+        ])
+        ShoppingCart.objects.bulk_create([ShoppingCart(user=user) for user in users])
+
+        def checkout_form(session):
+            user = session.user
+            return {
+                'street': '1 Bench St', 'city': 'Bench City', 'postal': '1000',
+                'first_name': user.first_name, 'last_name': user.last_name, 'username': user.username,
+                'email': user.email, 'phone': user.phone, 'payment_method': 'COD',
+            }
+
+        return {'users': users, 'product_ids': [p.pk for p in products], 'checkout_form': checkout_form}
+
+    def start_server(self):
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+        server.set_app(WSGIHandler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f'http://127.0.0.1:{server.server_port}'
+
+    def run(self, data, base_url, options):
+        samples = defaultdict(list)
+        lock = threading.Lock()
+        scenarios = [SCENARIOS[name] for name in options['scenarios']]
+        errors = []
+
+        def worker(user, seed):
+            local = defaultdict(list)
+            transport = (ClientTransport if base_url is None else HTTPTransport)(base_url)
+            session = Session(transport, local)
+            session.user = user
+            worker_rng = random.Random(seed)
+            try:
+                session.record = False
+                session.get('login', reverse('login'))
+                session.post('login', reverse('login'), {'username': user.email, 'password': PASSWORD})
+                for iteration in range(options['warmup'] + options['iterations']):
+                    session.record = iteration >= options['warmup']
+                    for scenario in scenarios:
+                        scenario(session, worker_rng, data)
+            except Exception as error:
+                errors.append(repr(error))
+            finally:
+                transport.close()
+                connections.close_all()
+            with lock:
+                for name, values in local.items():
+                    samples[name].extend(values)
+
+        rng = random.Random(options['seed'])
+        threads = [threading.Thread(target=worker, args=(user, rng.random())) for user in data['users']]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise CommandError('Workers failed: ' + '; '.join(errors))
+        return samples, elapsed
+
+    def results(self, samples, elapsed, options):
+        urls = {}
+        for name in sorted(samples):
+            values = samples[name]
+            timing = summary([v[0] for v in values])
+            queries = [v[1] for v in values if v[1] is not None]
+            urls[name] = {
+                'requests': len(values),
+                'errors': sum(1 for v in values if v[2] >= 400),
+                'throughput_rps': round(len(values) / elapsed, 2),
+                'mean_ms': round(timing['mean_ms'], 3),
+                'p50_ms': round(timing['p50_ms'], 3),
+                'p95_ms': round(timing['p95_ms'], 3),
+                'p99_ms': round(timing['p99_ms'], 3),
+                'avg_queries': round(sum(queries) / len(queries), 2) if queries else None,
+                'max_queries': max(queries) if queries else None,
+            }
+        total = sum(url['requests'] for url in urls.values())
+        return {
+            'meta': {
+                'commit': self.commit(),
+                'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                **{key: options[key] for key in ('scenarios', 'concurrency', 'iterations', 'products',
+                                                 'transport', 'db_profile', 'seed')},
+            },
+            'total': {'requests': total, 'seconds': round(elapsed, 3), 'throughput_rps': round(total / elapsed, 2)},
+            'urls': urls,
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  timeout=10).stdout.strip() or None
+        except OSError:
+            return None
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{'url name':<20} {'reqs':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+        )
+        for name, url in results['urls'].items():
+            queries = '-' if url['avg_queries'] is None else f"{url['avg_queries']:.1f}"
+            self.stdout.write(
+                f"{name:<20} {url['requests']:>6} {url['errors']:>4} {url['throughput_rps']:>8.1f} "
+                f"{url['p50_ms']:>8.2f} {url['p95_ms']:>8.2f} {url['p99_ms']:>8.2f} {queries:>8}"
+            )
+        total = results['total']
+        self.stdout.write(f"{total['requests']} requests in {total['seconds']:.2f}s ({total['throughput_rps']:.1f} req/s)")
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        self.stdout.write(f"\nAgainst {baseline['meta'].get('commit') or 'baseline'}:")
+        self.stdout.write(f"{'url name':<20} {'p95 before':>10} {'p95 now':>10} {'change':>8} {'queries':>12}")
+        for name, url in results['urls'].items():
+            before = baseline['urls'].get(name)
+            if not before:
+                continue
+            change = url['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+            queries = f"{before['avg_queries']} -> {url['avg_queries']}"
+            self.stdout.write(
+                f"{name:<20} {before['p95_ms']:>10.2f} {url['p95_ms']:>10.2f} {change * 100:>7.1f}% {queries:>12}"
+            )
+            if change > threshold:
+                regressions.append(f'{name} p95 +{change * 100:.0f}%')
+            if None not in (url['avg_queries'], before['avg_queries']) and url['avg_queries'] > before['avg_queries']:
+                regressions.append(f"{name} queries {before['avg_queries']} -> {url['avg_queries']}")
+        if regressions:
+            raise CommandError('Regressions: ' + ', '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
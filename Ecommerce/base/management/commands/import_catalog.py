@@ -0,0 +1,82 @@
+from contextlib import nullcontext
+import os, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from base import catalog, pagecache
+from base.sampling import product_sampler
+
+
+class Command(BaseCommand):
+    help = ('Create or update products from a CSV or JSON-lines file with the columns sku, name, price, '
+            'stock, category and optionally description, image, on_trend, is_active. Products are matched '
+            'on sku; missing categories are created.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(catalog.READERS), help='Taken from the extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Check every row and report; write nothing.')
+        parser.add_argument('--atomic', action='store_true',
+                            help='One transaction for the whole file: any bad row imports nothing. By default '
+                                 'every chunk commits on its own and bad rows are skipped.')
+        parser.add_argument('--image-dir', help='Where relative image paths start; the file\'s folder by default.')
+        parser.add_argument('--max-errors', type=int, default=100, help='Give up after this many bad rows.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').replace('ndjson', 'jsonl')
+        if fmt not in catalog.READERS:
+            raise CommandError(f'Unknown format {fmt!r}; pass --format.')
+        self.atomic, self.max_errors = options['atomic'], options['max_errors']
+        image_dir = options['image_dir'] or os.path.dirname(os.path.abspath(path))
+
+        start = time.perf_counter()
+        importer, chunk, rows, self.errors = None, [], 0, []
+        with open(path, newline='', encoding='utf-8-sig') as f, \
+                (transaction.atomic() if self.atomic and not options['dry_run'] else nullcontext()):
+            for number, row in catalog.READERS[fmt](f):
+                rows += 1
+                try:
+                    if isinstance(row, catalog.RowError):
+                        raise row
+                    if importer is None:
+                        importer = catalog.CatalogImport(row.keys(), image_dir, dry_run=options['dry_run'])
+                    chunk.append(importer.product(row))
+                except catalog.RowError as error:
+                    if importer is None and not isinstance(row, catalog.RowError):
+                        raise CommandError(str(error))
+                    self.skip(number, error)
+                    continue
+                if len(chunk) >= options['chunk_size']:
+                    importer.write_chunk(chunk, self.atomic)
+                    chunk = []
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{rows:,} rows, {time.perf_counter() - start:.1f}s')
+            if chunk:
+                importer.write_chunk(chunk, self.atomic)
+
+        if importer and not options['dry_run'] and importer.created + importer.updated:
+            # The bulk writes skip the Product signals (the search index is kept per chunk)
+            product_sampler.invalidate()
+            pagecache.bump_version()
+
+        elapsed = time.perf_counter() - start
+        created, updated = (importer.created, importer.updated) if importer else (0, 0)
+        new_categories = len(importer.new_categories) if importer else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Dry run, nothing written: ' if options['dry_run'] else ''}"
+            f'{rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s): {created:,} created, '
+            f'{updated:,} updated, {len(self.errors):,} skipped, {new_categories:,} new categories.'
+        ))
+        if importer and 'image' in importer.columns and not options['dry_run']:
+            self.stdout.write('Run generate_image_variants for the responsive copies of new images.')
+
+    def skip(self, number, error):
+        if self.atomic:
+            raise CommandError(f'Line {number}: {error}. Nothing was imported.')
+        self.errors.append(number)
+        self.stderr.write(f'Line {number}: {error}')
+        if len(self.errors) >= self.max_errors:
+            raise CommandError(f'{len(self.errors)} bad rows, giving up; the chunks before were imported.')
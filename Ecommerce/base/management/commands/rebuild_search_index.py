@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from base import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index from the Product table.'
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError('The full-text search index is only available on SQLite.')
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} products in {time.perf_counter() - start:.2f}s.'
+        ))
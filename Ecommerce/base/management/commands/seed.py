@@ -0,0 +1,283 @@
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+import math, random, string, time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import now
+
+from base import pagecache, search
+from base.models import Address, Category, Customer, Product
+from order.models import (CanceledItem, CartItem, DeliveredItem, Order, OrderItem, Payment, Shipping,
+                          ShoppingCart)
+
+BRANDS = ['Nike', 'Adidas', 'Puma', 'Fila', 'Reebok', 'Skechers', 'New Balance', 'Asics', 'Converse', 'Vans',
+          'Jordan', 'Under Armour', 'Saucony', 'Hoka', 'Mizuno', 'Brooks']
+MODELS = ['Air', 'Zoom', 'Max', 'Retro', 'Court', 'Runner', 'Classic', 'Ultra', 'Boost', 'Flex', 'Trail', 'Glide',
+          'Pegasus', 'Gel', 'Wave', 'Fresh', 'Foam', 'Speed', 'Chuck', 'Old Skool']
+STYLES = ['Low', 'Mid', 'High', 'OG', 'SE', 'Premium', 'Lite', 'Pro', 'GTX', '2', '3', '90', '97']
+FIRST_NAMES = ['Juan', 'Maria', 'Jose', 'Ana', 'Mark', 'Grace', 'John', 'Angel', 'Paolo', 'Bea', 'Carlo', 'Joy',
+               'Miguel', 'Kim', 'Rafael', 'Liza', 'Daniel', 'Camille', 'Luis', 'Trisha']
+LAST_NAMES = ['Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos', 'Aquino',
+              'Castillo', 'Villanueva', 'Gonzales', 'Dela Cruz', 'Navarro', 'Domingo']
+CITIES = ['Quezon City', 'Manila', 'Davao City', 'Cebu City', 'Makati', 'Pasig', 'Taguig', 'Baguio', 'Iloilo City']
+IMAGES = ['images/products/AIRJORDAN11RETROLOW.png', 'images/products/204477_CHOC.png',
+          'images/products/462550920_968985131734853_9123405273677761850_n.png',
+          'images/products/462646546_1253242195882384_8658897584658186992_n.png']
+
+PAYMENT_METHODS = [(Payment.CASH_ON_DELIVERY, 45), (Payment.GCASH, 30), (Payment.PAYMAYA, 15), (Payment.PAYPAL, 10)]
+SHIPPING_STATUS = {Order.PENDING: 'Not Shipped', Order.SHIPPED: 'Shipped', Order.DELIVERED: 'Delivered',
+                   Order.CANCELED: 'Canceled'}
+ITEM_COUNTS = [50, 25, 12, 8, 5]  # weights for 1, 2, 3 ... items per order
+QUANTITIES = [80, 15, 5]  # weights for 1, 2, 3 units per line
+GROWTH = 2.0  # the newest day sees (1 + GROWTH) times the orders of the oldest one
+
+
+class Picker:
+    # Weighted choice over a fixed population with bisect on cumulative weights:
+    # O(log n) per pick, memory proportional to the population, not to the picks
+    def __init__(self, rng, population, weights):
+        self.rng = rng
+        self.population = population
+        self.cumulative = list(accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def pick(self):
+        return self.population[bisect(self.cumulative, self.rng.random() * self.total)]
+
+    def distinct(self, k):
+        k = min(k, len(self.population))
+        picked = []
+        while len(picked) < k:
+            value = self.pick()
+            if value not in picked:
+                picked.append(value)
+        return picked
+
+
+def zipf(n, s=1.1):
+    # Popularity by rank: a few bestsellers and heavy customers, a long tail
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+@contextmanager
+def explicit_dates(*fields):
+    # auto_now_add would overwrite the generated history dates with now()
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a deterministic synthetic catalog, customers, carts and order history '
+            '(skewed popularity, growing order volume). Writes in chunked bulk inserts, one transaction per chunk.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=len(BRANDS))
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--carts', type=float, default=0.2, help='Share of customers with a filled cart.')
+        parser.add_argument('--days', type=int, default=730, help='How far back the order history goes.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--password', default='seed-password',
+                            help='Password of every generated customer (hashed once, not per user).')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.prefix = f"seed{options['seed']}"
+        if Customer.objects.filter(email__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f"Seed {options['seed']} is already loaded; pick another --seed.")
+
+        start = time.perf_counter()
+        categories = self.create_categories(options['categories'])
+        products = self.create_products(options['products'], categories)
+        customers = self.create_customers(options['customers'], options['password'])
+        self.create_carts(customers, products, options['carts'])
+        self.create_orders(options['orders'], customers, products, options['days'])
+
+        search.rebuild()
+        pagecache.bump_version()
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.perf_counter() - start:.1f}s.'))
+
+    def chunks(self, total):
+        for offset in range(0, total, self.chunk_size):
+            yield offset, min(self.chunk_size, total - offset)
+
+    def report(self, label, count, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{label}: {count:,} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f}/s)')
+
+    def create_categories(self, count):
+        names = [BRANDS[i % len(BRANDS)] + (f' {i // len(BRANDS) + 1}' if i >= len(BRANDS) else '')
+                 for i in range(count)]
+        with transaction.atomic():
+            return Category.objects.bulk_create([Category(name=name) for name in names])
+
+    def create_products(self, count, categories):
+        rng = self.rng
+        start = time.perf_counter()
+        brand = Picker(rng, categories, zipf(len(categories), 0.8))
+        products = []  # (id, price) only, so the order loop stays small
+        for offset, size in self.chunks(count):
+            batch = []
+            for i in range(offset, offset + size):
+                category = brand.pick()
+                name = f'{category.name} {rng.choice(MODELS)} {rng.choice(STYLES)} {i}'
+                price = Decimal(max(499, round(math.exp(rng.gauss(math.log(3500), 0.55)), -1)))
+                batch.append(Product(
+                    name=name,
+                    description=f'{name}: {rng.choice(MODELS).lower()} cushioning, {rng.choice(STYLES).lower()} '
+                                f'cut, made for {rng.choice(["running", "court", "street", "trail", "training"])}.',
+                    price=price,
+                    stock=rng.randint(0, 500),
+                    image=rng.choice(IMAGES),
+                    category=category,
+                    on_trend=rng.random() < 0.05,
+                    is_active=rng.random() < 0.95,
+                ))
+            with transaction.atomic():
+                products.extend((p.pk, p.price) for p in Product.objects.bulk_create(batch))
+        self.report('products', count, start)
+        return products
+
+    def create_customers(self, count, password):
+        rng = self.rng
+        start = time.perf_counter()
+        password = make_password(password)
+        ids = []
+        for offset, size in self.chunks(count):
+            batch = []
+            for i in range(offset, offset + size):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                batch.append(Customer(
+                    email=f'{self.prefix}-{i}@example.com', username=f'{self.prefix}-{i}',
+                    first_name=first, last_name=last, phone=f'09{rng.randint(100000000, 999999999)}',
+                    password=password,
+                ))
+            with transaction.atomic():
+                customers = Customer.objects.bulk_create(batch)
+                Address.objects.bulk_create([
+                    Address(user_id=customer.pk, street=f'{rng.randint(1, 999)} {rng.choice(LAST_NAMES)} St',
+                            city=rng.choice(CITIES), postal=str(rng.randint(1000, 9800)))
+                    for customer in customers
+                ])
+            ids.extend(customer.pk for customer in customers)
+        self.report('customers', count, start)
+        return ids
+
+    def create_carts(self, customers, products, share):
+        rng = self.rng
+        start = time.perf_counter()
+        popular = Picker(rng, products, zipf(len(products)))
+        owners = [pk for pk in customers if rng.random() < share]
+        for offset, size in self.chunks(len(owners)):
+            with transaction.atomic():
+                carts = ShoppingCart.objects.bulk_create([ShoppingCart(user_id=pk) for pk in owners[offset:offset + size]])
+                CartItem.objects.bulk_create([
+                    CartItem(cart_id=cart.pk, product_id=product[0], quantity=rng.choice((1, 1, 1, 2)))
+                    for cart in carts
+                    for product in popular.distinct(rng.randint(1, 4))
+                ])
+                ShoppingCart.update_subtotals([cart.pk for cart in carts])
+        self.report('carts', len(owners), start)
+
+    def order_time(self, index, total, begin, span):
+        # Orders are generated oldest first with a linearly growing daily volume:
+        # the inverse CDF of density (1 + GROWTH * x) on [0, 1], plus a little jitter
+        p = (index + self.rng.random()) / total
+        x = (-1 + math.sqrt(1 + 2 * GROWTH * p * (1 + GROWTH / 2))) / GROWTH
+        return begin + span * x
+
+    def order_status(self, age):
+        roll = self.rng.random()
+        if age > timedelta(days=7):
+            return Order.CANCELED if roll < 0.12 else Order.DELIVERED
+        if age > timedelta(days=3):
+            return Order.CANCELED if roll < 0.1 else Order.SHIPPED if roll < 0.7 else Order.DELIVERED
+        return Order.CANCELED if roll < 0.15 else Order.PENDING
+
+    def create_orders(self, count, customers, products, days):
+        if not count:
+            return
+        rng = self.rng
+        start = time.perf_counter()
+        # Shuffle before ranking so the heavy buyers aren't simply the first accounts
+        ranked = customers[:]
+        rng.shuffle(ranked)
+        buyer = Picker(rng, ranked, zipf(len(ranked), 0.7))
+        popular = Picker(rng, products, zipf(len(products)))
+        item_count = Picker(rng, list(range(1, len(ITEM_COUNTS) + 1)), ITEM_COUNTS)
+        quantity = Picker(rng, [1, 2, 3], QUANTITIES)
+        method = Picker(rng, [m for m, _ in PAYMENT_METHODS], [w for _, w in PAYMENT_METHODS])
+        addresses = dict(Address.objects.filter(user_id__in=customers).values_list('user_id', 'street'))
+        current = now()
+        begin, span = current - timedelta(days=days), timedelta(days=days)
+        rows = 0
+
+        with explicit_dates(Order._meta.get_field('created_at'), Payment._meta.get_field('payment_date')):
+            for offset, size in self.chunks(count):
+                orders, lines = [], []
+                for i in range(offset, offset + size):
+                    created = self.order_time(i, count, begin, span)
+                    user_id = buyer.pick()
+                    items = [(product, quantity.pick()) for product in popular.distinct(item_count.pick())]
+                    orders.append(Order(
+                        user_id=user_id,
+                        status=self.order_status(current - created),
+                        total_price=sum(price * qty for (pk, price), qty in items),
+                        shipping_address=f"{addresses.get(user_id, '')}, Philippines",
+                        created_at=created,
+                    ))
+                    lines.append(items)
+
+                with transaction.atomic():
+                    orders = Order.objects.bulk_create(orders)
+                    order_items, delivered, canceled, payments, shipments = [], [], [], [], []
+                    for order, items in zip(orders, lines):
+                        history = (delivered if order.status == Order.DELIVERED
+                                   else canceled if order.status == Order.CANCELED else None)
+                        for (product_id, price), qty in items:
+                            order_items.append(OrderItem(order_id=order.pk, product_id=product_id, quantity=qty, price=price))
+                            if history is not None:
+                                model = DeliveredItem if history is delivered else CanceledItem
+                                history.append(model(order_id=order.pk, product_id=product_id, quantity=qty, price=price))
+
+                        payment_method = method.pick()
+                        if order.status == Order.CANCELED:
+                            payment_status = Payment.FAILED
+                        elif payment_method == Payment.CASH_ON_DELIVERY and order.status != Order.DELIVERED:
+                            payment_status = Payment.PENDING
+                        else:
+                            payment_status = Payment.COMPLETED
+                        payments.append(Payment(order_id=order.pk, payment_method=payment_method,
+                                                payment_status=payment_status, payment_date=order.created_at))
+                        shipments.append(Shipping(
+                            order_id=order.pk, shipping_method='Standard',
+                            shipping_status=SHIPPING_STATUS[order.status],
+                            tracking_number=''.join(rng.choices(string.ascii_letters + string.digits, k=8)),
+                            shipping_date=order.created_at + timedelta(days=rng.randint(3, 7)),
+                        ))
+
+                    OrderItem.objects.bulk_create(order_items)
+                    DeliveredItem.objects.bulk_create(delivered)
+                    CanceledItem.objects.bulk_create(canceled)
+                    Payment.objects.bulk_create(payments)
+                    Shipping.objects.bulk_create(shipments)
+                rows += len(orders) + len(order_items) + len(delivered) + len(canceled) + len(payments) + len(shipments)
+
+                done = offset + size
+                if done % (self.chunk_size * 20) == 0 or done == count:
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(f'orders: {done:,}/{count:,} ({done / elapsed:,.0f} orders/s, {rows:,} rows)')
+        self.report('orders', count, start)
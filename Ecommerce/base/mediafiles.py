@@ -0,0 +1,119 @@
+import mimetypes, os, re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed
+
+
+# Serves MEDIA_ROOT with DEBUG off (django.views.static.serve is for development only).
+# - ETag / Last-Modified with If-None-Match / If-Modified-Since -> 304
+# - Range: bytes=... -> 206 with just that part (video seeking, resumed downloads)
+# - Content-hashed names (base/storage.py) are cached for a year as immutable,
+#   anything else for MEDIA_MAX_AGE seconds
+# - MEDIA_OFFLOAD = 'x-accel-redirect' or 'x-sendfile' leaves sending the bytes to
+#   nginx / Apache, Django only checks the file and sets the headers
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def cache_control(path):
+    if is_hashed(path):
+        return IMMUTABLE
+    return f"public, max-age={getattr(settings, 'MEDIA_MAX_AGE', 3600)}"
+
+
+def parse_range(header, size):
+    # Only a single range; anything else gets the whole file, as the RFC allows.
+    # Returns (start, end) inclusive, None for the whole file, or False if unsatisfiable.
+    match = RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:  # bytes=-500: the last 500 bytes
+        length = int(last)
+        if not length:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, ValueError):
+        raise Http404('No such media file.')
+    if not os.path.isfile(full_path):
+        raise Http404('No such media file.')
+
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    offload = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if offload:
+        # The web server handles ranges itself from here
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + path
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if range_header and request.headers.get('If-Range', etag) == etag:
+            byte_range = parse_range(range_header, stat.st_size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(full_path, start, end), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            # FileResponse uses wsgi.file_wrapper (sendfile) when the server has it
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
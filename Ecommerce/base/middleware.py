@@ -0,0 +1,167 @@
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+import threading, time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+# Per-request query instrumentation.
+# Counts the queries, DB time and repeated statements of every request through
+# connection.execute_wrapper, reports them in the Server-Timing header and keeps a
+# rolling per-view summary in memory (see query_report in base/views.py).
+# Turn it off with QUERY_INSTRUMENTATION = False in settings.
+
+class QueryRecorder:
+    __slots__ = ('count', 'duration', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            # The SQL still has its placeholders, so the same statement with other
+            # parameters gets the same fingerprint: that's what an N+1 looks like
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.statements.items() if count > 1}
+
+
+class QueryStats:
+    # Rolling window of the last `window` requests per view, plus the statements
+    # that were most often repeated within one request
+    def __init__(self, window=500, max_fingerprints=20):
+        self.window = window
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._requests = defaultdict(lambda: deque(maxlen=self.window))
+        self._duplicates = defaultdict(Counter)
+
+    def add(self, view_name, recorder, total, duplicates):
+        with self._lock:
+            self._requests[view_name].append((recorder.count, recorder.duration, total, sum(duplicates.values())))
+            if duplicates:
+                counter = self._duplicates[view_name]
+                counter.update(duplicates)
+                if len(counter) > self.max_fingerprints * 2:
+                    self._duplicates[view_name] = Counter(dict(counter.most_common(self.max_fingerprints)))
+
+    def summary(self):
+        with self._lock:
+            views = {name: list(samples) for name, samples in self._requests.items()}
+            duplicates = {name: counter.most_common(5) for name, counter in self._duplicates.items()}
+
+        result = {}
+        for name, samples in views.items():
+            count = len(samples)
+            result[name] = {
+                'requests': count,
+                'avg_queries': round(sum(s[0] for s in samples) / count, 2),
+                'max_queries': max(s[0] for s in samples),
+                'avg_db_ms': round(sum(s[1] for s in samples) / count * 1000, 3),
+                'avg_total_ms': round(sum(s[2] for s in samples) / count * 1000, 3),
+                'avg_duplicate_queries': round(sum(s[3] for s in samples) / count, 2),
+                'top_duplicates': [{'sql': sql, 'count': hits} for sql, hits in duplicates.get(name, [])],
+            }
+        return dict(sorted(result.items(), key=lambda item: -item[1]['avg_queries']))
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._duplicates.clear()
+
+
+query_stats = QueryStats()
+
+
+class QueryCountMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.install(stack, recorder)
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        # Under ASGI the queries run in the request's sync_to_async thread (one per request,
+        # shared by every thread-sensitive call), and connections are per thread: the
+        # wrapper has to be installed and removed from there
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self.install)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    @staticmethod
+    def install(stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def finish(self, request, response, recorder, total):
+        match = request.resolver_match
+        view_name = (match.view_name or match._func_path) if match else 'unresolved'
+        duplicates = recorder.duplicates()
+        query_stats.add(view_name, recorder, total, duplicates)
+
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+            f'dup;desc="{sum(duplicates.values())} repeated", '
+            f'total;dur={total * 1000:.2f}'
+        )
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    # WhiteNoise is sync only: under ASGI Django would run it, and so every request
+    # behind it, through a thread. Same lookup here, without leaving the event loop
+    # for requests that aren't static files.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)  # stats the disk
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
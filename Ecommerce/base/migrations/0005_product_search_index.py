@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# FTS5 index used by base.search; only created on SQLite
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS base_product_search "
+        "USING fts5(name, description, category, tokenize='porter unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO base_product_search(rowid, name, description, category) "
+        "SELECT p.id, p.name, p.description, c.name FROM base_product p "
+        "LEFT JOIN base_category c ON c.id = p.category_id WHERE p.is_active"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS base_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_delete_productvariant'),
+        ('order', '0003_remove_cartitem_size'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -53,13 +53,14 @@ class Address(models.Model):
     postal = models.CharField(max_length=300, blank=True)
 
     def __str__(self):
-        return f'{self.street}, {self.purok}, {self.city}, {self.region}'
+        return f'{self.street}, {self.city}, {self.postal}'
 
     
 # Category Model
 class Category(models.Model):
     name = models.CharField(max_length=100) 
     image = models.ImageField(upload_to='images/logo', null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # see base/images.py
 
     def __str__(self):
         return self.name
@@ -74,9 +75,11 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
     image = models.ImageField(upload_to='images/products/', null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # see base/images.py
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE, default=1)
     on_trend = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    sku = models.CharField(max_length=255, unique=True, null=True, blank=True)  # upsert key of import_catalog
 
     def __str__(self):
         return self.name
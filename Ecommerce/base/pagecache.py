@@ -0,0 +1,186 @@
+from collections import Counter
+import hashlib, threading, uuid
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+
+# Cache for the catalog pages (home, product_detail, search_product) and the product cards.
+# - Keys carry the catalog version; the Product/Category signals bump it, which makes every
+#   older entry unreachable (the LRU of the 'pages' cache evicts them in time). The version
+#   lives in the 'catalog' cache, shared by all the workers, so a bump reaches every one.
+# - Whole pages are only cached for anonymous GETs without a guest cart. Logged-in users
+#   and guests with a cart get their own navbar and cart badge, but still reuse the cached
+#   product cards.
+# - Everything is rendered with a placeholder instead of the CSRF token; the requester's
+#   token is put in just before the response goes out, so no token is ever shared.
+VERSION_KEY = 'catalog:version'
+CSRF_PLACEHOLDER = 'CSRF-TOKEN-PLACEHOLDER-d1c5a9'
+
+
+def page_cache():
+    return caches['pages']
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, kind, hit):
+        with self._lock:
+            self._counts[kind, 'hits' if hit else 'misses'] += 1
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self._counts)
+        result = {}
+        for kind in sorted({kind for kind, _ in counts}):
+            hits, misses = counts.get((kind, 'hits'), 0), counts.get((kind, 'misses'), 0)
+            result[kind] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 3)}
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+cache_stats = CacheStats()
+
+
+def version_cache():
+    return caches['catalog']
+
+
+def new_version():
+    # A random version rather than a counter: incr() of a file or LocMem cache isn't atomic
+    # across processes, and two bumps must never end on the same value
+    return uuid.uuid4().hex[:16]
+
+
+def catalog_version():
+    cache = version_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def acatalog_version():
+    cache = version_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, new_version(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    version_cache().set(VERSION_KEY, new_version(), timeout=None)
+
+
+def make_key(kind, version, *parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'{kind}:{version}:{digest}'
+
+
+def get(kind, key):
+    value = page_cache().get(key)
+    cache_stats.record(kind, value is not None)
+    return value
+
+
+async def aget(kind, key):
+    value = await page_cache().aget(key)
+    cache_stats.record(kind, value is not None)
+    return value
+
+
+def card_key(version, pk):
+    return make_key('card', version, pk)
+
+
+class CardBatch:
+    # The product cards of one async page: read with one aget_many() before rendering, the
+    # missing ones rendered by the {% product_card %} tag and written with aset_many() after,
+    # so the template doesn't touch the cache from inside the event loop
+    def __init__(self, cached):
+        self.cached = cached
+        self.rendered = {}
+
+    def get(self, key):
+        return self.cached.get(key)
+
+    def add(self, key, html):
+        self.rendered[key] = html
+
+
+async def aget_cards(products, version):
+    keys = [card_key(version, product.pk) for product in products]
+    cached = await page_cache().aget_many(keys) if keys else {}
+    for key in keys:
+        cache_stats.record('card', key in cached)
+    return CardBatch(cached)
+
+
+def insert_csrf_token(request, content):
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+    return content
+
+
+def is_shared(request, user):
+    from order import guestcart  # order imports base
+    return not user.is_authenticated and not guestcart.count(request.session)
+
+
+def render(request, template_name, get_context, key=None):
+    # Like django.shortcuts.render, for the catalog views.
+    # get_context is only called on a miss, so a hit runs no queries for the page itself.
+    # key identifies the page (view name + arguments); None never caches the whole page.
+    version = catalog_version()
+    cacheable = key is not None and request.method == 'GET' and is_shared(request, request.user)
+    if cacheable:
+        cache_key = make_key('page', version, *key)
+        content = get('page', cache_key)
+        if content is not None:
+            return HttpResponse(insert_csrf_token(request, content))
+
+    context = get_context()
+    context.update(csrf_token=CSRF_PLACEHOLDER, catalog_version=version)
+    content = render_to_string(template_name, context, request)
+    if cacheable:
+        page_cache().set(cache_key, content)
+    return HttpResponse(insert_csrf_token(request, content))
+
+
+async def arender(request, template_name, get_context, key=None):
+    # render() for the async views: get_context is a coroutine function, and the context
+    # processors' values come from their async counterparts (context_processor.acontext).
+    # Also used with key=None for the async pages that are never cached (cart, order status).
+    # The caches are read with aget()/aset(), the product cards included (CardBatch): a file
+    # or redis backend would block the event loop.
+    from .context_processor import acontext  # it imports this module
+
+    version = await acatalog_version()
+    user = await request.auser()
+    cacheable = key is not None and request.method == 'GET' and is_shared(request, user)
+    if cacheable:
+        cache_key = make_key('page', version, *key)
+        content = await aget('page', cache_key)
+        if content is not None:
+            return HttpResponse(insert_csrf_token(request, content))
+
+    context = await acontext(request)
+    context.update(await get_context())
+    cards = await aget_cards(context.get('products') or [], version)
+    context.update(csrf_token=CSRF_PLACEHOLDER, catalog_version=version, product_cards=cards)
+    content = render_to_string(template_name, context, request)
+    if cards.rendered:
+        await page_cache().aset_many(cards.rendered)
+    if cacheable:
+        await page_cache().aset(cache_key, content)
+    return HttpResponse(insert_csrf_token(request, content))
@@ -0,0 +1,105 @@
+from array import array
+from bisect import bisect_left
+import random, threading, time
+
+from .models import Product
+from . import pagecache
+
+
+# Random product picker for the home page.
+# Keeps a sorted array of active product ids (8 bytes per product) instead of
+# loading every Product row, then fetches only the k rows that were picked.
+# The signals keep the index of the worker that saved a product up to date; the others see
+# the shared catalog version (base/pagecache.py) change and rebuild theirs.
+class ProductSampler:
+    def __init__(self, max_age=300):
+        self.max_age = max_age  # seconds before the index is rebuilt anyway (covers queryset.update())
+        self._ids = None
+        self._built_at = 0.0
+        self._version = None  # catalog version the index was built at
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _active_ids():
+        return Product.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)
+
+    def _build(self, version):
+        ids = array('q', self._active_ids().iterator(chunk_size=10000))
+        self._ids, self._version = ids, version
+        self._built_at = time.monotonic()
+        return ids
+
+    async def _abuild(self, version):
+        # No lock: two concurrent rebuilds in the event loop only cost one extra query
+        ids = array('q')
+        async for pk in self._active_ids().aiterator(chunk_size=10000):
+            ids.append(pk)
+        self._ids, self._version = ids, version
+        self._built_at = time.monotonic()
+        return ids
+
+    def _stale(self, ids, version):
+        # The version is read before a rebuild, so a bump during the rebuild causes another one
+        return ids is None or version != self._version or time.monotonic() - self._built_at > self.max_age
+
+    def index(self):
+        ids, version = self._ids, pagecache.catalog_version()
+        if self._stale(ids, version):
+            with self._lock:
+                ids = self._ids
+                if self._stale(ids, version):
+                    ids = self._build(version)
+        return ids
+
+    async def aindex(self):
+        ids, version = self._ids, await pagecache.acatalog_version()
+        if self._stale(ids, version):
+            ids = await self._abuild(version)
+        return ids
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+    # Called from the Product signals so the index is kept up to date without a rebuild
+    def add(self, pk):
+        with self._lock:
+            ids = self._ids
+            if ids is None:
+                return
+            i = bisect_left(ids, pk)
+            if i == len(ids) or ids[i] != pk:
+                ids.insert(i, pk)
+
+    def discard(self, pk):
+        with self._lock:
+            ids = self._ids
+            if ids is None:
+                return
+            i = bisect_left(ids, pk)
+            if i < len(ids) and ids[i] == pk:
+                del ids[i]
+
+    @staticmethod
+    def _rows():
+        # One query for the picked rows with their category joined
+        return Product.objects.select_related('category').filter(is_active=True)
+
+    def sample(self, k):
+        ids = self.index()
+        picked = random.sample(ids, min(len(ids), k))
+        if not picked:
+            return []
+        products = self._rows().in_bulk(picked)
+        return [products[pk] for pk in picked if pk in products]
+
+    async def asample(self, k):
+        ids = await self.aindex()
+        picked = random.sample(ids, min(len(ids), k))
+        if not picked:
+            return []
+        products = await self._rows().ain_bulk(picked)
+        return [products[pk] for pk in picked if pk in products]
+
+
+product_sampler = ProductSampler()
@@ -0,0 +1,197 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Category, Product
+
+
+# Full-text product search backed by an SQLite FTS5 table (see migration 0005).
+# The table holds one row per active product, keyed by the product id:
+#   base_product_search(rowid = product.id, name, description, category)
+SEARCH_TABLE = 'base_product_search'
+
+# SQLite 3.40 corrupts an FTS5 table when one transaction deletes a row, runs a prefix query
+# and then inserts a row ("database disk image is malformed"). The index is only written
+# from saves and imports and only searched from the catalog views and the admin changelist,
+# which never share a transaction; keep it that way.
+
+# Column weights for bm25(): a hit in the name counts most, then the category
+RANK = f'bm25({SEARCH_TABLE}, 10.0, 1.0, 5.0)'
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_query(text):
+    # Turn user input into a safe FTS5 query: every word must match,
+    # the last one as a prefix so results show up while typing ("jord" -> Jordan)
+    words = WORD.findall(text or '')
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def index_product(product):
+    if not is_enabled():
+        return
+    if not product.is_active:
+        remove_product(product.pk)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, name, description, category) '
+            'VALUES (%s, %s, %s, (SELECT name FROM base_category WHERE id = %s))',
+            [product.pk, product.name, product.description, product.category_id],
+        )
+
+
+def remove_product(pk):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [pk])
+
+
+def matches(text):
+    # The ids of the active products matching text, for filter(pk__in=...); None without a query
+    query = build_query(text)
+    if not query:
+        return None
+    return RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [query])
+
+
+def reindex_products(queryset):
+    # index_product() for many products at once, e.g. a chunk of a catalog import
+    if not is_enabled():
+        return
+    ids, params = queryset.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({ids})', params)
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE}(rowid, name, description, category) '
+            'SELECT p.id, p.name, p.description, c.name FROM base_product p '
+            f'LEFT JOIN base_category c ON c.id = p.category_id WHERE p.is_active AND p.id IN ({ids})',
+            params,
+        )
+
+
+def reindex_category(category):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {SEARCH_TABLE} SET category = %s '
+            'WHERE rowid IN (SELECT id FROM base_product WHERE category_id = %s)',
+            [category.name, category.pk],
+        )
+
+
+def rebuild():
+    # Refill the whole index in two statements; used by the rebuild_search_index command
+    if not is_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE}(rowid, name, description, category) '
+            'SELECT p.id, p.name, p.description, c.name FROM base_product p '
+            'LEFT JOIN base_category c ON c.id = p.category_id WHERE p.is_active'
+        )
+        cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+class SearchPage:
+    def __init__(self, products, number, has_next):
+        self.object_list = products
+        self.number = number
+        self.has_next = has_next
+        self.has_previous = number > 1
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def _ranked_ids(query, offset, per_page):
+    # Every match is scored and the page is cut inside FTS5, so the best match comes first
+    # however old the product is. Fetches one extra id to know if there is a next page, so
+    # no count(*) over all matches.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY {RANK}, rowid DESC LIMIT %s OFFSET %s',
+            [query, per_page + 1, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _products():
+    return Product.objects.select_related('category')
+
+
+def search(text, page=1, per_page=20):
+    # Returns one page of products ranked by relevance
+    page = max(1, page)
+    offset = (page - 1) * per_page
+
+    if not is_enabled():
+        return _fallback_search(text, page, per_page, offset)
+
+    query = build_query(text)
+    if not query:
+        return SearchPage([], page, False)
+
+    ids = _ranked_ids(query, offset, per_page)
+    has_next = len(ids) > per_page
+    ids = ids[:per_page]
+    products = _products().in_bulk(ids)
+    return SearchPage([products[pk] for pk in ids if pk in products], page, has_next)
+
+
+async def asearch(text, page=1, per_page=20):
+    page = max(1, page)
+    offset = (page - 1) * per_page
+
+    if not is_enabled():
+        return await sync_to_async(_fallback_search)(text, page, per_page, offset)
+
+    query = build_query(text)
+    if not query:
+        return SearchPage([], page, False)
+
+    # There is no async cursor for raw SQL; this runs in the request's ORM thread,
+    # like the async queryset methods do
+    ids = await sync_to_async(_ranked_ids)(query, offset, per_page)
+    has_next = len(ids) > per_page
+    ids = ids[:per_page]
+    products = await _products().ain_bulk(ids)
+    return SearchPage([products[pk] for pk in ids if pk in products], page, has_next)
+
+
+def _fallback_search(text, page, per_page, offset):
+    # Other databases: the old icontains search, at least limited to one page
+    if not text:
+        return SearchPage([], page, False)
+    categories = Category.objects.filter(name__icontains=text)
+    products = list(
+        Product.objects.select_related('category')
+        .filter(Q(name__icontains=text) | Q(description__icontains=text) | Q(category__in=categories), is_active=True)
+        .order_by('id')[offset:offset + per_page + 1]
+    )
+    return SearchPage(products[:per_page], page, len(products) > per_page)
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Product
+from .sampling import product_sampler
+from . import images, pagecache, search
+
+SEARCH_FIELDS = {'name', 'description', 'category', 'is_active'}
+
+
+# Keep the home page sampler index, the search index, the image variants and the page cache
+# in sync with the catalog. The catalog version is bumped once the change is committed: a
+# page rendered in between would read the old rows and be cached under the new version.
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'is_active' in update_fields:
+        if instance.is_active:
+            product_sampler.add(instance.pk)
+        else:
+            product_sampler.discard(instance.pk)
+
+    if update_fields is None or SEARCH_FIELDS.intersection(update_fields):
+        search.index_product(instance)
+
+    if update_fields is None or 'image' in update_fields:
+        images.schedule_variants(instance)
+
+    transaction.on_commit(pagecache.bump_version)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    product_sampler.discard(instance.pk)
+    search.remove_product(instance.pk)
+    transaction.on_commit(pagecache.bump_version)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if not created and (update_fields is None or 'name' in update_fields):
+        search.reindex_category(instance)
+
+    if update_fields is None or 'image' in update_fields:
+        images.schedule_variants(instance)
+
+    transaction.on_commit(pagecache.bump_version)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    transaction.on_commit(pagecache.bump_version)
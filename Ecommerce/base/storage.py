@@ -0,0 +1,36 @@
+import hashlib, posixpath, re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+HASH_LENGTH = 12
+HASHED_NAME = re.compile(rf'\.[0-9a-f]{{{HASH_LENGTH}}}\.\w+$')
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+# Default storage for uploads: the file name carries a hash of the content,
+#   images/products/shoe.png -> images/products/shoe.3f2a9c1b4d5e.png
+# so a URL never points to different bytes and can be cached forever (see base/mediafiles.py).
+# Uploading the same picture twice reuses the existing file.
+class HashedMediaStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        root, ext = posixpath.splitext(name)
+        name = f'{root}.{digest.hexdigest()[:HASH_LENGTH]}{ext}'
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,33 @@
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from base import pagecache
+
+register = template.Library()
+
+
+# {% product_card product %}
+# The product card of the home and search pages, cached per product and catalog version
+# (see base/pagecache.py). Rendered with the CSRF placeholder so one copy serves everyone.
+@register.simple_tag(takes_context=True)
+def product_card(context, product):
+    version = context.get('catalog_version') or pagecache.catalog_version()
+    key = pagecache.card_key(version, product.pk)
+    batch = context.get('product_cards')  # async pages: prefetched, written back by arender()
+    html = batch.get(key) if batch is not None else pagecache.get('card', key)
+    if html is None:
+        html = render_to_string('base/product_card.html', {
+            'product': product,
+            'csrf_token': pagecache.CSRF_PLACEHOLDER,
+        })
+        if batch is not None:
+            batch.add(key, html)
+        else:
+            pagecache.page_cache().set(key, html)
+
+    token = context.get('csrf_token')
+    if token is not None and str(token) != pagecache.CSRF_PLACEHOLDER:
+        # Rendered outside pagecache.render(): put the real token in here
+        html = html.replace(pagecache.CSRF_PLACEHOLDER, str(token))
+    return mark_safe(html)
@@ -0,0 +1,37 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name, size in variants)
+
+
+# {% responsive_image product sizes="300px" alt=product.name class="yellow" %}
+# A <picture> with the WebP variants and a JPEG fallback, letting the browser pick the
+# width it needs for `sizes`. Falls back to the original while the variants are missing
+# or made for an older upload. Extra keyword arguments become <img> attributes.
+@register.simple_tag
+def responsive_image(obj, sizes='100vw', **attrs):
+    image = getattr(obj, 'image', None)
+    if not image:
+        return ''
+    attrs.setdefault('alt', '')
+    attrs.setdefault('loading', 'lazy')
+    attributes = format_html_join(' ', '{}="{}"', attrs.items())
+
+    variants = getattr(obj, 'image_variants', None) or {}
+    if variants.get('source') != image.name or not variants.get('jpeg'):
+        return format_html('<img src="{}" {}>', image.url, attributes)
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" decoding="async" {}>'
+        '</picture>',
+        _srcset(variants['webp']), sizes,
+        default_storage.url(variants['jpeg'][-1][1]), _srcset(variants['jpeg']), sizes,
+        attributes,
+    )
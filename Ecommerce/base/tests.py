@@ -1,3 +1,351 @@
-from django.test import TestCase
+import io, multiprocessing, os, shutil, tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from order.models import CartItem, ShoppingCart
+from Ecommerce import database
+from . import mediafiles, pagecache, search
+from .backends import EmailOrUsernameBackend
+from .sampling import ProductSampler
+from .models import Category, Customer, Product
+
+
+class CatalogVersionTests(SimpleTestCase):
+    def test_bump_changes_the_version(self):
+        version = pagecache.catalog_version()
+        pagecache.bump_version()
+        self.assertNotEqual(pagecache.catalog_version(), version)
+
+    def test_bump_reaches_other_processes(self):
+        # A product edited through another worker: this one must stop using the old pages
+        version = pagecache.catalog_version()
+        worker = multiprocessing.get_context('fork').Process(target=pagecache.bump_version)
+        worker.start()
+        worker.join()
+        self.assertEqual(worker.exitcode, 0)
+        self.assertNotEqual(pagecache.catalog_version(), version)
+
+    def test_async_lookup_sees_the_bump(self):
+        pagecache.bump_version()
+        self.assertEqual(async_to_sync(pagecache.acatalog_version)(), pagecache.catalog_version())
+
+
+class ImportCatalogTests(TestCase):
+    def import_file(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        call_command('import_catalog', f.name, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_sku_column_is_required(self):
+        # Matching on names would merge different products that share one
+        with self.assertRaisesMessage(CommandError, 'missing columns: sku'):
+            self.import_file('name,price,stock,category\nShoe,10,1,Brand\n')
+        self.assertFalse(Product.objects.exists())
+
+    def test_repricing_refreshes_cart_subtotals(self):
+        self.import_file('sku,name,price,stock,category\nS1,Shoe,100,5,Brand\nS2,Boot,200,5,Brand\n')
+        cart = ShoppingCart.objects.create(
+            user=Customer.objects.create(email='c@example.com', username='c', password='!'))
+        for product in Product.objects.all():
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        ShoppingCart.update_subtotals([cart.pk])
+
+        self.import_file('sku,name,price,stock,category\nS1,Shoe,99.5,5,Brand\nS2,Boot,200,5,Brand\n')
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, cart.get_total_price())
+        self.assertEqual(cart.subtotal, 599)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Category.objects.count(), 1)
+
+
+class CatalogVersionSignalTests(TestCase):
+    def test_bumped_after_the_commit(self):
+        category = Category.objects.create(name='Brand')
+        version = pagecache.catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Shoe', description='Shoe', price=10, stock=1, category=category)
+            product.price = 12
+            product.save()
+            self.assertEqual(pagecache.catalog_version(), version)  # not committed yet
+        self.assertNotEqual(pagecache.catalog_version(), version)
+
+
+class AsyncOnlyCache:
+    # A cache whose sync methods aren't there: like a file or redis backend, they would block
+    # the event loop
+    def __init__(self):
+        self.data = {}
+
+    async def aget(self, key, default=None):
+        return self.data.get(key, default)
+
+    async def aset(self, key, value):
+        self.data[key] = value
+
+    async def aget_many(self, keys):
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    async def aset_many(self, values):
+        self.data.update(values)
+
+
+class AsyncProductCardTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Brand')
+        self.products = [
+            Product.objects.create(name=f'Shoe {i}', description='Shoe', price=10, stock=1, category=category,
+                                   image='images/products/AIRJORDAN11RETROLOW.png')
+            for i in range(2)
+        ]
+        self.cache = AsyncOnlyCache()
+        patcher = mock.patch.object(pagecache, 'page_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def render(self):
+        request = RequestFactory().get('/')
+        SessionMiddleware(lambda r: None).process_request(request)
+        AuthenticationMiddleware(lambda r: None).process_request(request)
+
+        async def context():
+            return {'products': self.products}
+
+        return async_to_sync(pagecache.arender)(request, 'base/home.html', context)
+
+    def test_cards_are_cached_without_sync_calls(self):
+        response = self.render()
+        self.assertContains(response, 'Shoe 1')
+        version = pagecache.catalog_version()
+        keys = [pagecache.card_key(version, product.pk) for product in self.products]
+        self.assertTrue(set(keys) <= set(self.cache.data))
+
+        # Served from the prefetched cards: a stale name shows the card wasn't rendered again
+        self.cache.data[keys[1]] = self.cache.data[keys[1]].replace('Shoe 1', 'Cached shoe')
+        self.assertContains(self.render(), 'Cached shoe')
+
+
+class EmailOrUsernameBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create_user('alice@example.com', 'secret', username='alice')
+        # Her username is Alice's email
+        cls.bob = Customer.objects.create_user('bob@example.com', 'secret', username='alice@example.com')
+
+    def authenticate(self, identifier, password='secret'):
+        backend = EmailOrUsernameBackend()
+        user = backend.authenticate(None, username=identifier, password=password)
+        self.assertEqual(async_to_sync(backend.aauthenticate)(None, username=identifier, password=password), user)
+        return user
+
+    def test_login_by_email(self):
+        self.assertEqual(self.authenticate('bob@example.com'), self.bob)
+
+    def test_login_by_username(self):
+        self.assertEqual(self.authenticate('alice'), self.alice)
+
+    def test_email_wins_over_username(self):
+        self.assertEqual(self.authenticate('alice@example.com'), self.alice)
+
+    def test_wrong_password(self):
+        self.assertIsNone(self.authenticate('alice', 'wrong'))
+
+    def test_unknown_identifier_still_hashes(self):
+        # As long as a wrong password, so the response doesn't tell which accounts exist
+        with mock.patch('django.contrib.auth.base_user.make_password') as make_password:
+            self.assertIsNone(self.authenticate('nobody@example.com'))
+        self.assertEqual(make_password.call_count, 2)  # once per authenticate() and aauthenticate()
+
+    def test_inactive_user(self):
+        Customer.objects.filter(pk=self.alice.pk).update(is_active=False)
+        self.assertIsNone(self.authenticate('alice'))
+        self.assertIsNone(self.authenticate('alice@example.com'))
+
+
+class ProductSamplerTests(TestCase):
+    # Another worker's save only reaches this one through the shared catalog version
+    def setUp(self):
+        self.category = Category.objects.create(name='Brand')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Shoe {i}', description='Shoe', price=10, stock=1, category=self.category)
+            for i in range(3)
+        ])
+        self.sampler = ProductSampler()
+
+    def test_rebuilds_when_the_catalog_version_changes(self):
+        self.assertEqual(list(self.sampler.index()), [p.pk for p in self.products])
+        # Saved elsewhere: no signal in this process, just the bump
+        new = Product.objects.bulk_create([Product(name='Boot', description='Boot', price=10, stock=1,
+                                                   category=self.category)])[0]
+        Product.objects.filter(pk=self.products[0].pk).update(is_active=False)
+        pagecache.bump_version()
+        self.assertEqual(list(self.sampler.index()), [self.products[1].pk, self.products[2].pk, new.pk])
+        self.assertEqual(len(async_to_sync(self.sampler.asample)(10)), 3)
+
+    def test_no_rebuild_while_the_version_holds(self):
+        self.sampler.index()
+        with self.assertNumQueries(0):
+            self.sampler.index()
+            async_to_sync(self.sampler.aindex)()
+
+
+class SearchTests(TestCase):
+    # The FTS5 index is kept by the Product/Category signals
+    def setUp(self):
+        self.nike = Category.objects.create(name='Nike')
+        self.jordan = self.product('Air Jordan 11', 'Basketball shoe')
+        self.runner = self.product('Pegasus Runner', 'Road shoe, not a jordan')
+
+    def product(self, name, description, **fields):
+        fields.setdefault('category', self.nike)
+        return Product.objects.create(name=name, description=description, price=100, stock=1, **fields)
+
+    def names(self, text, **kwargs):
+        return [product.name for product in search.search(text, **kwargs)]
+
+    def test_indexed_on_save(self):
+        self.assertEqual(self.names('pegasus'), ['Pegasus Runner'])
+        self.runner.name = 'Vomero Runner'
+        self.runner.save()
+        self.assertEqual(self.names('pegasus'), [])
+        self.assertEqual(self.names('vomero'), ['Vomero Runner'])
+
+    def set_active(self, active):
+        self.jordan.is_active = active
+        self.jordan.save(update_fields=['is_active'])
+
+    def test_deactivated_products_leave_the_index(self):
+        self.set_active(False)
+        self.assertEqual(self.names('basketball'), [])
+
+    def test_reactivated_products_come_back(self):
+        # No search in between: see the SQLite note in base/search.py
+        self.set_active(False)
+        self.set_active(True)
+        self.assertEqual(self.names('basketball'), ['Air Jordan 11'])
+
+    def test_deleted_products_leave_the_index(self):
+        self.jordan.delete()
+        self.assertEqual(self.names('basketball'), [])
+
+    def test_category_rename_reindexes_its_products(self):
+        self.nike.name = 'Swoosh'
+        self.nike.save()
+        self.assertEqual(sorted(self.names('swoosh')), ['Air Jordan 11', 'Pegasus Runner'])
+        self.assertEqual(self.names('nike'), [])
+
+    def test_name_match_ranks_above_description_match(self):
+        # The runner is newer and mentions jordan only in its description
+        self.assertEqual(self.names('jordan'), ['Air Jordan 11', 'Pegasus Runner'])
+
+    def test_last_word_matches_as_a_prefix(self):
+        self.assertEqual(self.names('air jor'), ['Air Jordan 11'])
+        self.assertEqual(self.names('jor air'), [])  # only the last word is a prefix
+        self.assertEqual(self.names('!!!'), [])
+
+    def test_has_next_at_the_page_boundary(self):
+        for i in range(3):
+            self.product(f'Trail {i}', 'Trail shoe')
+        first = search.search('trail', per_page=2)
+        self.assertTrue(first.has_next)
+        second = search.search('trail', page=2, per_page=2)
+        self.assertFalse(second.has_next)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(len({p.pk for p in first} | {p.pk for p in second}), 3)
+        exact = search.search('trail', per_page=3)
+        self.assertEqual(len(exact), 3)
+        self.assertFalse(exact.has_next)
+        self.assertEqual([p.pk for p in async_to_sync(search.asearch)('trail', per_page=3)], [p.pk for p in exact])
+
+
+class MediaServeTests(SimpleTestCase):
+    CONTENT = bytes(range(256)) * 4  # 1024 bytes
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for name in ('clip.bin', 'shoe.3f2a9c1b4d5e.png'):
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(self.CONTENT)
+        settings = override_settings(MEDIA_ROOT=root, MEDIA_MAX_AGE=3600, MEDIA_OFFLOAD=None)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get(self, name='clip.bin', **headers):
+        return mediafiles.serve(RequestFactory().get('/media/' + name, headers=headers), name)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_etag_then_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        revalidated = self.get(if_none_match=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_first_bytes(self):
+        response = self.get(range='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-9/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.body(response), self.CONTENT[:10])
+
+    def test_last_bytes(self):
+        response = self.get(range='bytes=-100')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 924-1023/1024')
+        self.assertEqual(self.body(response), self.CONTENT[-100:])
+        # More than the file: all of it
+        self.assertEqual(self.get(range='bytes=-5000')['Content-Range'], 'bytes 0-1023/1024')
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=1024-', 'bytes=2000-3000', 'bytes=-0', 'bytes=9-3'):
+            with self.subTest(range=header):
+                response = self.get(range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range_mismatch_sends_the_whole_file(self):
+        etag = self.get()['ETag']
+        response = self.get(range='bytes=0-9', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+        self.assertEqual(self.get(range='bytes=0-9', if_range=etag).status_code, 206)
+
+    def test_cache_control(self):
+        self.assertEqual(self.get('shoe.3f2a9c1b4d5e.png')['Cache-Control'], mediafiles.IMMUTABLE)
+        self.assertEqual(self.get()['Cache-Control'], 'public, max-age=3600')
+
+    def test_offload_headers(self):
+        with override_settings(MEDIA_OFFLOAD='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/'):
+            response = self.get(range='bytes=0-9')
+            self.assertEqual(response.status_code, 200)  # the web server does the range
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/clip.bin')
+            self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_OFFLOAD='x-sendfile'):
+            response = self.get()
+            self.assertEqual(response['X-Sendfile'], os.path.join(mediafiles.settings.MEDIA_ROOT, 'clip.bin'))
+
+    def test_missing_and_escaping_paths(self):
+        with self.assertRaises(Http404):
+            self.get('nothing.png')
+        with self.assertRaises(SuspiciousFileOperation):  # a 400 from Django
+            self.get('../settings.py')
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_no_persistent_connections_under_asgi(self):
+        self.assertEqual(database.sqlite('db.sqlite3', 'production')['CONN_MAX_AGE'], 600)
+        settings = database.sqlite('db.sqlite3', 'production', asgi=True)
+        self.assertEqual(settings['CONN_MAX_AGE'], 0)
+        self.assertIn('journal_mode=WAL', settings['OPTIONS']['init_command'])
@@ -1,21 +1,26 @@
-from django.urls import path
-from . import views
+from django.urls import path, re_path
+from . import views, mediafiles
 from django.conf.urls.static import static
 from django.conf import settings
 
+# Async variants of the read-only pages when served by Ecommerce/asgi.py (settings.ASYNC_VIEWS)
+use_async = settings.ASYNC_VIEWS
+
 urlpatterns = [
-    path('', views.home, name='home'), # Main Page Url
+    path('', views.ahome if use_async else views.home, name='home'), # Main Page Url
     path('logout/', views.user_logout, name='logout'), # Logout Page Url
     path('accounts/register/', views.register, name='register'), # Register user Page Url
     path('accounts/login/', views.user_login, name='login'), # Login Page Url
     path('address/<str:pk>/', views.address, name='address'), # User Address
-    path('search_product/', views.search_product, name='search_product'), # Searched Products
+    path('search_product/', views.asearch_product if use_async else views.search_product, name='search_product'), # Searched Products
     path('edit_profile/<int:pk>/', views.edit_customer, name='edit_profile'), # Edit User Profile Information
-    path('product_detail/<str:pk>/', views.product_detail, name='product_detail'), # Product Detail Page Url
+    path('product_detail/<str:pk>/', views.aproduct_detail if use_async else views.product_detail, name='product_detail'), # Product Detail Page Url
+    path('debug/queries/', views.query_report, name='query_report'), # Query Counts per View (Staff Only)
+    path('debug/cache/', views.cache_report, name='cache_report'), # Page Cache Hits and Misses (Staff Only)
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", mediafiles.serve, name='media'), # Uploaded Images (also with DEBUG off)
 
 ]
 
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
@@ -6,47 +6,83 @@ from .models import *
 from order.models import *
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from .forms import *
+from .sampling import product_sampler
+from . import pagecache, search
+from .middleware import query_stats
+import random
 
 # Home Page - Show products
+HOME_VARIANTS = 8  # differently sampled copies of the home page that anonymous visitors rotate through
+
 def home(request):
-    categories = Category.objects.all()
-    active_products = Product.objects.filter(is_active=True)
-    selected_products = random.sample(list(active_products), min(len(active_products), 10))
-
-    return render(request, 'base/home.html', {
-        'categories': categories, 
-        'products': selected_products,
-        })
-    
+    def context():
+        return {
+            'products': product_sampler.sample(10), # Random pick without loading the whole catalog
+        }
+
+    return pagecache.render(request, 'base/home.html', context, key=('home', random.randrange(HOME_VARIANTS)))
+
+async def ahome(request):
+    async def context():
+        return {'products': await product_sampler.asample(10)}
+
+    return await pagecache.arender(request, 'base/home.html', context, key=('home', random.randrange(HOME_VARIANTS)))
+
 def search_product(request):
-    if request.method == 'POST':
-        searched = request.POST['searched']
-        
-        # Search for SCategories
-        subcategories = Category.objects.filter(name__icontains=searched)
-        
-        # Fetch Products associated with the matched Categories
-        products = Product.objects.filter(
-            Q(name__icontains=searched) |
-            Q(category__in=subcategories)
-        )
-        
-        return render(request, 'base/search_product.html', {
-            'searched': searched,
-            'products': products,
-            'subcategories': subcategories,
-        })
-
-    return render(request, 'base/search_product.html', {})
+    searched = request.POST.get('searched') or request.GET.get('searched')
+    if searched is not None:
+        # Ranked full-text search over product name, description and category
+        try:
+            page = int(request.GET.get('page', 1))
+        except ValueError:
+            page = 1
+
+        def context():
+            return {
+                'searched': searched,
+                'products': search.search(searched, page=page),
+            }
+
+        return pagecache.render(request, 'base/search_product.html', context, key=('search', searched, page))
+
+    return pagecache.render(request, 'base/search_product.html', dict, key=('search',))
+
+async def asearch_product(request):
+    searched = request.POST.get('searched') or request.GET.get('searched')
+    if searched is not None:
+        try:
+            page = int(request.GET.get('page', 1))
+        except ValueError:
+            page = 1
+
+        async def context():
+            return {
+                'searched': searched,
+                'products': await search.asearch(searched, page=page),
+            }
+
+        return await pagecache.arender(request, 'base/search_product.html', context, key=('search', searched, page))
+
+    async def empty():
+        return {}
+
+    return await pagecache.arender(request, 'base/search_product.html', empty, key=('search',))
 
 # Product Detail
 def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    return render(request, 'base/product_detail.html', {
-        'product': product,
-    })
+    def context():
+        return {'product': get_object_or_404(Product.objects.select_related('category'), pk=pk)}
+
+    return pagecache.render(request, 'base/product_detail.html', context, key=('product', pk))
+
+async def aproduct_detail(request, pk):
+    async def context():
+        return {'product': await aget_object_or_404(Product.objects.select_related('category'), pk=pk)}
+
+    return await pagecache.arender(request, 'base/product_detail.html', context, key=('product', pk))
 
 
 # Edit User Customer
@@ -120,4 +156,20 @@ def user_login(request):
 def user_logout(request):
     logout(request)
     # return redirect('home',{'hide_navbar': True})  # Redirect to home page after logout
-    return redirect(home)  # Redirect to home page after logout
\ No newline at end of file
+    return redirect(home)  # Redirect to home page after logout
+
+
+# Query counts per view collected by QueryCountMiddleware (staff only)
+@staff_member_required
+def query_report(request):
+    if request.method == 'POST' and 'reset' in request.POST:
+        query_stats.reset()
+    return JsonResponse(query_stats.summary())
+
+
+# Page and product card cache hit/miss counts (staff only)
+@staff_member_required
+def cache_report(request):
+    if request.method == 'POST' and 'reset' in request.POST:
+        pagecache.cache_stats.reset()
+    return JsonResponse(pagecache.cache_stats.summary())
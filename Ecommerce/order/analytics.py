@@ -0,0 +1,159 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import (DailyCategorySales, DailyPaymentSales, DailyProductSales, Order, OrderItem, Payment,
+                     SummaryState)
+
+
+# Daily sales summaries (see the Daily*Sales models).
+# refresh() only re-aggregates the days from the high-water mark (the newest created_at seen
+# by the last run) minus REOPEN_DAYS: orders are still shipped, delivered or canceled for a
+# while after they were placed, and those status changes must reach their day's row. A change
+# older than that (a late cancellation of a delivered order) is picked up by a full refresh.
+# Days are processed in batches, each written in its own short transaction, so checkouts
+# aren't kept waiting for the write lock while months of history are aggregated.
+STATE = 'sales'
+REOPEN_DAYS = 30
+BATCH_DAYS = 31
+
+LINE_TOTAL = ExpressionWrapper(F('quantity') * F('price'), DecimalField(max_digits=14, decimal_places=2))
+ZERO = Decimal('0')
+
+
+def _sums(units, revenue, canceled):
+    # Sums of the not canceled and of the canceled rows; `canceled` is the Q for the latter
+    return {
+        'units': Coalesce(Sum(units, filter=~canceled), 0),
+        'revenue': Coalesce(Sum(revenue, filter=~canceled), ZERO),
+        'canceled_units': Coalesce(Sum(units, filter=canceled), 0),
+        'canceled_revenue': Coalesce(Sum(revenue, filter=canceled), ZERO),
+    }
+
+
+def _item_rows(since, before, until, group):
+    canceled = Q(order__status=Order.CANCELED)
+    return (OrderItem.objects
+            .filter(order__created_at__gte=since, order__created_at__lt=before, order__created_at__lte=until)
+            .annotate(day=TruncDate('order__created_at'))
+            .values('day', group)
+            .annotate(**_sums('quantity', LINE_TOTAL, canceled))
+            .order_by())
+
+
+def product_rows(since, before, until):
+    for row in _item_rows(since, before, until, 'product_id'):
+        yield DailyProductSales(day=row['day'], product_id=row['product_id'], units=row['units'],
+                                revenue=row['revenue'], canceled_units=row['canceled_units'],
+                                canceled_revenue=row['canceled_revenue'])
+
+
+def category_rows(since, before, until):
+    for row in _item_rows(since, before, until, 'product__category_id'):
+        yield DailyCategorySales(day=row['day'], category_id=row['product__category_id'], units=row['units'],
+                                 revenue=row['revenue'], canceled_units=row['canceled_units'],
+                                 canceled_revenue=row['canceled_revenue'])
+
+
+def payment_rows(since, before, until):
+    canceled = Q(status=Order.CANCELED)
+    rows = (Order.objects
+            .filter(created_at__gte=since, created_at__lt=before, created_at__lte=until, payment__isnull=False)
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'payment__payment_method')
+            .annotate(orders=Count('id', filter=~canceled), canceled_orders=Count('id', filter=canceled),
+                      revenue=Coalesce(Sum('total_price', filter=~canceled), ZERO),
+                      canceled_revenue=Coalesce(Sum('total_price', filter=canceled), ZERO))
+            .order_by())
+    for row in rows:
+        yield DailyPaymentSales(day=row['day'], payment_method=row['payment__payment_method'], orders=row['orders'],
+                                revenue=row['revenue'], canceled_orders=row['canceled_orders'],
+                                canceled_revenue=row['canceled_revenue'])
+
+
+SUMMARIES = {
+    DailyProductSales: product_rows,
+    DailyCategorySales: category_rows,
+    DailyPaymentSales: payment_rows,
+}
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def refresh(full=False, reopen_days=REOPEN_DAYS, batch_days=BATCH_DAYS):
+    # Returns the number of summary rows written per model, and the first day refreshed
+    state, _ = SummaryState.objects.get_or_create(name=STATE)
+    bounds = Order.objects.aggregate(oldest=Min('created_at'), newest=Max('created_at'))
+    until = bounds['newest']  # orders placed while this runs are left for the next run
+    written = Counter()
+    if until is None:
+        return written, None
+
+    if full or state.high_water is None:
+        first = timezone.localdate(bounds['oldest'])
+        for model in SUMMARIES:
+            model.objects.filter(day__lt=first).delete()
+    else:
+        first = timezone.localdate(state.high_water) - timedelta(days=reopen_days)
+    last = timezone.localdate(until)
+
+    day = first
+    while day <= last:
+        end = min(day + timedelta(days=batch_days), last + timedelta(days=1))
+        since, before = day_start(day), day_start(end)
+        # Aggregated before the transaction; only the delete and insert hold the write lock
+        batches = {model: list(rows(since, before, until)) for model, rows in SUMMARIES.items()}
+        with transaction.atomic():
+            for model, objs in batches.items():
+                model.objects.filter(day__gte=day, day__lt=end).delete()
+                model.objects.bulk_create(objs, batch_size=1000)
+                written[model.__name__] += len(objs)
+        day = end
+
+    state.high_water = until
+    state.refreshed_at = timezone.now()
+    state.save(update_fields=['high_water', 'refreshed_at'])
+    return written, first
+
+
+def _rate(canceled, kept):
+    total = canceled + kept
+    return canceled / total * 100 if total else 0
+
+
+def dashboard(days):
+    # Reads the summaries only: the cost depends on days x products, not on the number of orders
+    since = timezone.localdate() - timedelta(days=days - 1)
+    totals = ('units', 'revenue', 'canceled_units', 'canceled_revenue')
+
+    def summed(queryset, *group, order_by='-revenue', limit=None):
+        rows = list(queryset.filter(day__gte=since).values(*group)
+                    .annotate(**{name: Sum(name) for name in totals}).order_by(order_by)[:limit])
+        for row in rows:
+            row['cancel_rate'] = _rate(row['canceled_units'], row['units'])
+        return rows
+
+    payments = list(DailyPaymentSales.objects.filter(day__gte=since).values('payment_method')
+                    .annotate(orders=Sum('orders'), revenue=Sum('revenue'),
+                              canceled_orders=Sum('canceled_orders'), canceled_revenue=Sum('canceled_revenue'))
+                    .order_by('-revenue'))
+    labels = dict(Payment.PAYMENT_METHOD_CHOICES)
+    for row in payments:
+        row['label'] = labels.get(row['payment_method'], row['payment_method'])
+        row['cancel_rate'] = _rate(row['canceled_orders'], row['orders'])
+
+    return {
+        'since': since,
+        'daily': summed(DailyCategorySales.objects, 'day', order_by='-day'),
+        'categories': summed(DailyCategorySales.objects, 'category__name'),
+        'products': summed(DailyProductSales.objects, 'product_id', 'product__name', limit=20),
+        'payments': payments,
+        'state': SummaryState.objects.filter(name=STATE).first(),
+    }
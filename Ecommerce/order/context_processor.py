@@ -1,10 +1,48 @@
-from .models import CartItem, ShoppingCart
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from .models import CartItem
+from . import guestcart
+
+CART_COUNT_TIMEOUT = 60 * 15  # bounds staleness after cart edits made outside the views (admin)
+
+
+def cart_count_key(user_id):
+    return f'cart_count:{user_id}'
+
+
+def invalidate_cart_count(user_id):
+    cache.delete(cart_count_key(user_id))
+
+
+def get_cart_count(request, user):
+    # The badge is read from the cache; the count query only runs on a miss.
+    # add_to_cart, remove_from_cart and checkout drop the entry when they change the cart.
+    # Visitors who aren't logged in get the size of their guest cart, from the session.
+    if not user.is_authenticated:
+        return guestcart.count(request.session)
+    key = cart_count_key(user.pk)
+    cart_count = cache.get(key)
+    if cart_count is None:
+        cart_count = CartItem.objects.filter(cart__user_id=user.pk).count()
+        cache.set(key, cart_count, CART_COUNT_TIMEOUT)
+    return cart_count
+
+
+async def aget_cart_count(request, user):
+    if not user.is_authenticated:
+        return guestcart.count(request.session)  # already loaded by auser()
+    key = cart_count_key(user.pk)
+    cart_count = await cache.aget(key)
+    if cart_count is None:
+        cart_count = await CartItem.objects.filter(cart__user_id=user.pk).acount()
+        await cache.aset(key, cart_count, CART_COUNT_TIMEOUT)
+    return cart_count
+
 
 def cart_count(request):
-    if request.user.is_authenticated:
-        cart = ShoppingCart.objects.get(user=request.user)
-        cart_items = CartItem.objects.filter(cart=cart)
-        cart_count = cart_items.count()
-    else:
-        cart_count = 0 
-    return {'cart_count': cart_count}
+    # Lazy, so the async views can pass their own value (acart_count) instead
+    return {'cart_count': SimpleLazyObject(lambda: get_cart_count(request, request.user))}
+
+
+async def acart_count(request):
+    return {'cart_count': await aget_cart_count(request, await request.auser())}
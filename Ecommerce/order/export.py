@@ -0,0 +1,136 @@
+import csv, io, json
+from datetime import timedelta
+from itertools import chain, groupby
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .analytics import day_start
+from .models import Order, OrderItem
+
+
+# Order export for accounting: one row per order item with its order, customer, payment and
+# shipping, read with values_list() over LEFT JOINs and .iterator(), so no model instances,
+# no per-row __str__ queries and a memory use that doesn't grow with the number of orders.
+# The output is produced in chunks of about CHUNK_BYTES for StreamingHttpResponse or a file.
+CHUNK_SIZE = 2000
+CHUNK_BYTES = 64 * 1024
+
+ORDER_FIELDS = {
+    'order_id': 'order_id',
+    'created_at': 'order__created_at',
+    'status': 'order__status',
+    'customer_email': 'order__user__email',
+    'total_price': 'order__total_price',
+    'shipping_address': 'order__shipping_address',
+    'payment_method': 'order__payment__payment_method',
+    'payment_status': 'order__payment__payment_status',
+    'transaction_id': 'order__payment__transaction_id',
+    'shipping_method': 'order__shipping__shipping_method',
+    'shipping_status': 'order__shipping__shipping_status',
+    'tracking_number': 'order__shipping__tracking_number',
+    'shipping_date': 'order__shipping__shipping_date',
+}
+ITEM_FIELDS = {
+    'product_id': 'product_id',
+    'product_name': 'product__name',
+    'quantity': 'quantity',
+    'price': 'price',
+}
+COLUMNS = list(ORDER_FIELDS) + list(ITEM_FIELDS) + ['line_total']
+DATETIME_COLUMNS = ('created_at', 'shipping_date')
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def orders(since=None, until=None, statuses=None):
+    # since/until are dates, both included, in the shop's time zone; compared as datetimes
+    # so the range is read from the created_at index
+    queryset = Order.objects.all()
+    if since:
+        queryset = queryset.filter(created_at__gte=day_start(since))
+    if until:
+        queryset = queryset.filter(created_at__lt=day_start(until + timedelta(days=1)))
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    return queryset
+
+
+def rows(queryset, chunk_size=CHUNK_SIZE):
+    # Ordered by order, so the lines of one order come out together
+    fields = list(ORDER_FIELDS.values()) + list(ITEM_FIELDS.values())
+    items = (OrderItem.objects
+             .filter(order__in=queryset.order_by().values('pk'))
+             .values_list(*fields)
+             .order_by('order_id', 'pk'))
+    # Only these columns need converting; the time zone is looked up once, not per value
+    tz = timezone.get_current_timezone()
+    datetimes = [COLUMNS.index(name) for name in DATETIME_COLUMNS]
+    for row in items.iterator(chunk_size=chunk_size):
+        row = list(row)
+        for i in datetimes:
+            if row[i] is not None:
+                row[i] = row[i].astimezone(tz).isoformat()
+        row.append(row[-2] * row[-1])
+        yield row
+
+
+def _in_chunks(lines):
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def csv_chunks(queryset, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def lines():
+        for row in chain([COLUMNS], rows(queryset, chunk_size)):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    return _in_chunks(lines())
+
+
+def jsonl_chunks(queryset, chunk_size=CHUNK_SIZE):
+    # One object per order with its lines nested under "items"
+    order_count, item_names = len(ORDER_FIELDS), list(ITEM_FIELDS) + ['line_total']
+
+    def lines():
+        for _, group in groupby(rows(queryset, chunk_size), key=lambda row: row[0]):
+            group = list(group)
+            record = dict(zip(ORDER_FIELDS, group[0][:order_count]))
+            record['items'] = [dict(zip(item_names, row[order_count:])) for row in group]
+            yield json.dumps(record, default=str) + '\n'
+    return _in_chunks(lines())
+
+
+WRITERS = {'csv': csv_chunks, 'jsonl': jsonl_chunks}
+
+
+async def _achunks(chunks):
+    # Under ASGI Django reads a sync iterator with sync_to_async(list), i.e. the whole export
+    # in memory before the first byte goes out. Pulled one chunk at a time instead, each in
+    # the request's thread (the ORM can't run in the event loop, and the cursor lives there).
+    pull = sync_to_async(next)
+    while (chunk := await pull(chunks, None)) is not None:
+        yield chunk
+
+
+def response(request, queryset, fmt, chunk_size=CHUNK_SIZE):
+    filename = f'orders-{timezone.localdate():%Y%m%d}.{fmt}'
+    chunks = WRITERS[fmt](queryset, chunk_size)
+    if isinstance(request, ASGIRequest):
+        chunks = _achunks(chunks)
+    streaming = StreamingHttpResponse(chunks, content_type=FORMATS[fmt])
+    streaming['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return streaming
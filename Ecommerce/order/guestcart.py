@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from base.models import Product
+from .models import CartItem, ShoppingCart
+
+
+# Cart of a visitor who isn't logged in, kept in the session as {product id: quantity}.
+# With the signed cookie sessions that's no database write at all; at login the whole
+# cart is merged into the customer's ShoppingCart with one bulk upsert (see merge()).
+SESSION_KEY = 'guest_cart'
+MAX_LINES = 50  # keeps the session cookie well under the 4 KB browsers accept
+
+
+class GuestCartFull(Exception):
+    pass
+
+
+def items(session):
+    return {int(pk): quantity for pk, quantity in session.get(SESSION_KEY, {}).items()}
+
+
+def count(session):
+    return len(session.get(SESSION_KEY, {}))
+
+
+def add(session, product_id, quantity):
+    if quantity < 1:
+        raise ValueError('quantity must be at least 1')
+    cart = session.get(SESSION_KEY, {})
+    key = str(product_id)  # JSON object keys are strings
+    if key not in cart and len(cart) >= MAX_LINES:
+        raise GuestCartFull
+    cart[key] = cart.get(key, 0) + quantity
+    session[SESSION_KEY] = cart
+
+
+def remove(session, product_id):
+    cart = session.get(SESSION_KEY, {})
+    if cart.pop(str(product_id), None) is not None:
+        session[SESSION_KEY] = cart
+
+
+def _lines(products, quantities):
+    # Shaped like ShoppingCart.lines_for() rows, so view_cart.html renders both
+    lines = [CartItem(product=product, quantity=quantities[product.pk]) for product in products]
+    for line in lines:
+        line.line_total = line.quantity * line.product.price
+    return lines
+
+
+def _products(quantities):
+    return Product.objects.filter(pk__in=list(quantities), is_active=True).order_by('pk')
+
+
+def lines(session):
+    quantities = items(session)
+    return _lines(_products(quantities), quantities) if quantities else []
+
+
+async def alines(session):
+    quantities = items(session)
+    return _lines([product async for product in _products(quantities)], quantities) if quantities else []
+
+
+def merge(user, session):
+    # Called at login. Quantities of products already in the customer's cart are added up:
+    # one SELECT for the still active products with what the cart already holds of them,
+    # then one INSERT ... ON CONFLICT DO UPDATE for every line. A line that doesn't add up
+    # to a positive quantity (a cart saved before add() checked it) is dropped, it would
+    # fail the CartItem.quantity check and with it every login from that browser.
+    quantities = items(session)
+    if not quantities:
+        return None
+    with transaction.atomic():
+        cart, _ = ShoppingCart.objects.get_or_create(user=user)
+        in_cart = CartItem.objects.filter(cart=cart, product=OuterRef('pk')).values('quantity')
+        rows = (Product.objects.filter(pk__in=list(quantities), is_active=True)
+                .values_list('pk', Coalesce(Subquery(in_cart), Value(0))))
+        totals = [(pk, quantities[pk] + held) for pk, held in rows]
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=pk, quantity=total) for pk, total in totals if total > 0],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
+        ShoppingCart.update_subtotals([cart.pk])
+    del session[SESSION_KEY]
+    return cart
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from order.models import CanceledItem, DeliveredItem, Order, copy_order_items
+
+
+class Command(BaseCommand):
+    help = ('Fill DeliveredItem/CanceledItem for existing delivered and canceled orders. '
+            'Works through the orders in fixed-size chunks; rows that already exist are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for status, model in ((Order.DELIVERED, DeliveredItem), (Order.CANCELED, CanceledItem)):
+            start = time.perf_counter()
+            before = model.objects.count()
+            orders = last_id = 0
+            while True:
+                # Keyset pagination on the primary key keeps every chunk query cheap
+                order_ids = list(
+                    Order.objects.filter(status=status, pk__gt=last_id)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:options['chunk_size']]
+                )
+                if not order_ids:
+                    break
+                with transaction.atomic():
+                    copy_order_items(model, order_ids)
+                orders += len(order_ids)
+                last_id = order_ids[-1]
+
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: {orders} orders checked, "
+                f"{model.objects.count() - before} rows added in {time.perf_counter() - start:.2f}s"
+            )
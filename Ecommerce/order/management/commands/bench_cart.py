@@ -0,0 +1,60 @@
+import gc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from base.benchmark import test_database, timed, summary
+from base.models import Category, Customer, Product
+from order.models import CartItem, ShoppingCart
+
+
+class Command(BaseCommand):
+    help = ('Query budget of the cart page for carts with a growing number of lines '
+            '(runs on a throwaway test database).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', nargs='+', type=int, default=[1, 10, 100])
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--budget', type=int, default=8, help='Fail if the page needs more queries.')
+
+    def handle(self, *args, **options):
+        over_budget = []
+        with test_database():
+            category = Category.objects.create(name='Bench')
+            products = Product.objects.bulk_create([
+                Product(name=f'Bench Product {i}', description='Benchmark product', price=100 + i, stock=100,
+                        image='images/products/AIRJORDAN11RETROLOW.png', category=category)
+                for i in range(max(options['lines']))
+            ])
+
+            self.stdout.write(f"{'lines':>6} {'queries':>7} {'mean ms':>9} {'p95 ms':>9}")
+            url = reverse('view_cart')
+            for count in options['lines']:
+                user = Customer.objects.create(email=f'bench{count}@example.com', username=f'bench{count}', password='!')
+                cart = ShoppingCart.objects.create(user=user)
+                CartItem.objects.bulk_create([
+                    CartItem(cart=cart, product=product, quantity=2) for product in products[:count]
+                ])
+                ShoppingCart.update_subtotals([cart.pk])
+
+                gc.collect()
+                client = Client()
+                client.force_login(user)
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(url)
+                query_count = len(queries)  # read now, the next request clears the query log
+
+                cart.refresh_from_db()
+                if cart.subtotal != cart.get_total_price():
+                    raise CommandError(f'Cached subtotal {cart.subtotal} != cart total {cart.get_total_price()}')
+
+                result = summary(timed(lambda: client.get(url), options['requests']))
+                self.stdout.write(f"{count:>6} {query_count:>7} {result['mean_ms']:>9.2f} {result['p95_ms']:>9.2f}")
+                if query_count > options['budget']:
+                    over_budget.append(f'{count} lines: {query_count} queries')
+
+        if over_budget:
+            raise CommandError('Over the query budget: ' + '; '.join(over_budget))
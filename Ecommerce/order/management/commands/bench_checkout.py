@@ -0,0 +1,117 @@
+import random, tempfile, threading, time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+
+from Ecommerce.database import apply_profile
+from base.benchmark import test_database
+from base.models import Category, Customer, Product
+from order.models import CartItem, InsufficientStock, Order, OrderItem, Payment, ShoppingCart
+
+
+class Command(BaseCommand):
+    help = ('Concurrent checkout stress test: many threads check out multi-product carts against '
+            'a small stock and the command verifies nothing was oversold (SQLite, WAL mode).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--users', type=int, default=400)
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--stock', type=int, default=50)
+        parser.add_argument('--cancel-rate', type=float, default=0.1)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_checkout runs against SQLite only.')
+
+        rng = random.Random(options['seed'])
+        with tempfile.TemporaryDirectory() as tmp, test_database(path=Path(tmp) / 'bench_checkout.sqlite3'):
+            # Every thread opens its own connection from these settings
+            apply_profile(connection.settings_dict, 'production')
+            connection.close()
+
+            users = self.setup_carts(rng, options)
+            initial_stock = dict(Product.objects.values_list('pk', 'stock'))
+            connection.close()
+
+            results = {'placed': 0, 'rejected': 0, 'canceled': 0}
+            lock = threading.Lock()
+            chunks = [users[i::options['threads']] for i in range(options['threads'])]
+
+            def worker(chunk, seed):
+                local_rng = random.Random(seed)
+                counts = {'placed': 0, 'rejected': 0, 'canceled': 0}
+                try:
+                    for user in chunk:
+                        try:
+                            order = Order.create_from_cart(
+                                user, CartItem.objects.filter(cart__user=user),
+                                'Bench address', Payment.GCASH, Payment.COMPLETED,
+                            )
+                        except InsufficientStock:
+                            counts['rejected'] += 1
+                            continue
+                        counts['placed'] += 1
+                        if local_rng.random() < options['cancel_rate'] and order.cancel_order():
+                            counts['canceled'] += 1
+                finally:
+                    connections.close_all()
+                with lock:
+                    for key, value in counts.items():
+                        results[key] += value
+
+            threads = [threading.Thread(target=worker, args=(chunk, rng.random())) for chunk in chunks]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            oversold = self.verify(initial_stock)
+
+        attempts = results['placed'] + results['rejected']
+        self.stdout.write(
+            f"{options['threads']} threads, {attempts} checkouts in {elapsed:.2f}s "
+            f"({attempts / elapsed:.1f} checkouts/s)"
+        )
+        self.stdout.write(
+            f"placed {results['placed']}, rejected (out of stock) {results['rejected']}, "
+            f"canceled {results['canceled']}"
+        )
+        if oversold:
+            raise CommandError(f'Stock mismatch for products: {oversold}')
+        self.stdout.write(self.style.SUCCESS('No oversell: stock + sold units match the initial stock for every product.'))
+
+    def setup_carts(self, rng, options):
+        category = Category.objects.create(name='Bench')
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench Product {i}', description='Benchmark product', price=100,
+                    stock=options['stock'], category=category)
+            for i in range(options['products'])
+        ])
+        users = Customer.objects.bulk_create([
+            Customer(email=f'bench{i}@example.com', username=f'bench{i}', password='!')
+            for i in range(options['users'])
+        ])
+        carts = ShoppingCart.objects.bulk_create([ShoppingCart(user=user) for user in users])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=rng.randint(1, 3))
+            for cart in carts
+            for product in rng.sample(products, rng.randint(1, 4))
+        ])
+        return users
+
+    def verify(self, initial_stock):
+        sold = dict(
+            OrderItem.objects.exclude(order__status=Order.CANCELED)
+            .values_list('product_id')
+            .annotate(units=Sum('quantity'))
+        )
+        return [
+            pk for pk, stock in Product.objects.values_list('pk', 'stock')
+            if stock + sold.get(pk, 0) != initial_stock[pk]
+        ]
@@ -0,0 +1,110 @@
+import multiprocessing, random, tempfile, time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+from django.db.models import F
+
+from Ecommerce.database import PROFILES, apply_profile
+from base.benchmark import test_database, summary
+from base.models import Category, Customer, Product
+from order.models import CartItem, ShoppingCart
+
+# What settings.py used before the profiles: no timeout beyond Python's 5s default,
+# deferred transactions, rollback journal, a new connection per request
+LEGACY = 'legacy'
+
+
+def add_to_cart(args):
+    # One worker process: `ops` add-to-cart transactions (read the product, then write),
+    # closing the connection after each one like the end of a request does
+    user_id, product_ids, ops, seed = args
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    try:
+        cart_id = ShoppingCart.objects.get(user_id=user_id).pk
+        for _ in range(ops):
+            start = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    product = Product.objects.get(pk=rng.choice(product_ids))
+                    item, created = CartItem.objects.get_or_create(cart_id=cart_id, product=product)
+                    if not created:
+                        CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + 1)
+                    ShoppingCart.update_subtotals([cart_id])
+            except OperationalError:  # database is locked
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+            close_old_connections()
+    finally:
+        connections.close_all()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = ('Write contention between worker processes on one SQLite file, for the legacy settings '
+            'and each profile in Ecommerce/database.py (runs on a throwaway test database).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=200, help='Transactions per process.')
+        parser.add_argument('--profiles', nargs='+', default=[LEGACY, *PROFILES])
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_db_contention runs against SQLite only.')
+        unknown = set(options['profiles']) - {LEGACY, *PROFILES}
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        rng = random.Random(options['seed'])
+        with tempfile.TemporaryDirectory() as tmp, test_database(path=Path(tmp) / 'bench_contention.sqlite3'):
+            category = Category.objects.create(name='Bench')
+            product_ids = [p.pk for p in Product.objects.bulk_create([
+                Product(name=f'Bench Product {i}', description='Benchmark product', price=100, stock=100,
+                        category=category)
+                for i in range(50)
+            ])]
+
+            self.stdout.write(
+                f"{'profile':<12} {'journal':<8} {'ok':>6} {'locked':>6} {'ops/s':>8} "
+                f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+            )
+            for profile in options['profiles']:
+                journal = self.use_profile(profile)
+                users = Customer.objects.bulk_create([
+                    Customer(email=f'{profile}{i}@example.com', username=f'{profile}{i}', password='!')
+                    for i in range(options['processes'])
+                ])
+                ShoppingCart.objects.bulk_create([ShoppingCart(user=user) for user in users])
+                jobs = [(user.pk, product_ids, options['ops'], rng.random()) for user in users]
+                connections.close_all()  # the forked workers must open their own connections
+
+                start = time.perf_counter()
+                with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+                    results = pool.map(add_to_cart, jobs)
+                elapsed = time.perf_counter() - start
+
+                latencies = [t for result in results for t in result[0]]
+                errors = sum(result[1] for result in results)
+                timing = summary(latencies) if latencies else {'p50_ms': 0, 'p95_ms': 0, 'p99_ms': 0}
+                self.stdout.write(
+                    f"{profile:<12} {journal:<8} {len(latencies):>6} {errors:>6} {len(latencies) / elapsed:>8.1f} "
+                    f"{timing['p50_ms']:>8.2f} {timing['p95_ms']:>8.2f} {timing['p99_ms']:>8.2f}"
+                )
+
+    def use_profile(self, profile):
+        settings_dict = connection.settings_dict
+        if profile == LEGACY:
+            settings_dict.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False, OPTIONS={})
+        else:
+            apply_profile(settings_dict, profile)
+        connection.close()
+        with connection.cursor() as cursor:
+            if 'journal_mode=WAL' not in settings_dict['OPTIONS'].get('init_command', ''):
+                # WAL sticks to the file; go back to the rollback journal for the other profiles
+                cursor.execute('PRAGMA journal_mode=DELETE')
+            cursor.execute('PRAGMA journal_mode')
+            return cursor.fetchone()[0]
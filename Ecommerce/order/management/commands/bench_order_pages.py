@@ -0,0 +1,74 @@
+from decimal import Decimal
+import gc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from base.benchmark import test_database, timed, summary
+from base.models import Category, Customer, Product
+from order.models import Order, OrderItem, Shipping
+
+
+class Command(BaseCommand):
+    help = ('Query budget of the order list and purchase history pages for customers with growing '
+            'order counts (runs on a throwaway test database).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', nargs='+', type=int, default=[10, 1000, 10000])
+        parser.add_argument('--items', type=int, default=3, help='Items per order.')
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--budget', type=int, default=12, help='Fail if a page needs more queries.')
+
+    def handle(self, *args, **options):
+        over_budget = []
+        with test_database():
+            category = Category.objects.create(name='Bench')
+            products = Product.objects.bulk_create([
+                Product(name=f'Bench Product {i}', description='Benchmark product', price=100, stock=100,
+                        image='images/products/AIRJORDAN11RETROLOW.png', category=category)
+                for i in range(options['items'])
+            ])
+
+            self.stdout.write(f"{'orders':>7} {'page':<16} {'queries':>7} {'mean ms':>9} {'p95 ms':>9}")
+            for count in options['orders']:
+                user = Customer.objects.create(email=f'bench{count}@example.com', username=f'bench{count}', password='!')
+                for status in (Order.PENDING, Order.DELIVERED, Order.CANCELED):
+                    self.create_orders(user, status, count, products)
+
+                gc.collect()  # don't time the collection of the objects created above
+                client = Client()
+                client.force_login(user)
+                for name in ('order_list', 'delivered_items', 'canceled_items'):
+                    url = reverse(name)
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(url)
+                    query_count = len(queries)  # read now, the next request clears the query log
+                    result = summary(timed(lambda: client.get(url), options['requests']))
+                    self.stdout.write(
+                        f"{count:>7} {name:<16} {query_count:>7} {result['mean_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+                    )
+                    if query_count > options['budget']:
+                        over_budget.append(f'{name} with {count} orders: {query_count} queries')
+
+        if over_budget:
+            raise CommandError('Over the query budget: ' + '; '.join(over_budget))
+
+    def create_orders(self, user, status, count, products):
+        with transaction.atomic():
+            for start in range(0, count, 1000):
+                orders = Order.objects.bulk_create([
+                    Order(user=user, status=status, total_price=Decimal(100 * len(products)),
+                          shipping_address='Bench address')
+                    for _ in range(min(1000, count - start))
+                ])
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product=product, quantity=1, price=product.price)
+                    for order in orders for product in products
+                ])
+                Shipping.objects.bulk_create([
+                    Shipping(order=order, shipping_method='Standard', shipping_status='Delivered')
+                    for order in orders
+                ])
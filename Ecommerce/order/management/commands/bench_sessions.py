@@ -0,0 +1,131 @@
+import re, time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from base.benchmark import test_database, summary
+from base.models import Address, Category, Customer, Product
+from base.sampling import product_sampler
+
+PASSWORD = 'bench-password'
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_TABLE = re.compile(r'\bdjango_session\b')
+ORDER_SUMMARY = re.compile(r'/order-summary/(\d+)/')
+
+
+class Command(BaseCommand):
+    help = ('django_session reads and writes per browse-and-buy flow for each session engine: browse as a '
+            'guest, fill a guest cart, log in (merging it), check out. Runs on a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flows', type=int, default=20, help='Flows per engine, one customer each.')
+        parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+
+    def handle(self, *args, **options):
+        # Login itself is covered by bench_login; a fast hash keeps it out of these timings
+        with test_database(), override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            category = Category.objects.create(name='Bench')
+            self.product_ids = [p.pk for p in Product.objects.bulk_create([
+                Product(name=f'Bench Product {i}', description='Benchmark product', price=100 + i, stock=10 ** 6,
+                        category=category, image='images/products/AIRJORDAN11RETROLOW.png')
+                for i in range(20)
+            ])]
+            product_sampler.invalidate()
+
+            self.reads = self.writes = self.queries = 0
+            with connection.execute_wrapper(self.count):
+                self.stdout.write(
+                    f"{'engine':<16} {'requests':>8} {'queries':>8} {'sess reads':>10} {'sess writes':>11} "
+                    f"{'cookie B':>8} {'ms/flow':>8}"
+                )
+                for name in options['engines']:
+                    self.run(name, options['flows'])
+
+    def count(self, execute, sql, params, many, context):
+        self.queries += 1
+        if SESSION_TABLE.search(sql):
+            if sql.lstrip().upper().startswith('SELECT'):
+                self.reads += 1
+            else:
+                self.writes += 1
+        return execute(sql, params, many, context)
+
+    def run(self, name, flows):
+        password = make_password(PASSWORD)
+        users = Customer.objects.bulk_create([
+            Customer(email=f'{name}{i}@example.com', username=f'{name}{i}', first_name='Bench', last_name=str(i),
+                     phone='09170000000', password=password)
+            for i in range(flows)
+        ])
+        Address.objects.bulk_create([Address(user=user, street='1 Bench St', city='Bench City', postal='1000')
+                                     for user in users])
+
+        timings, requests, cookie = [], 0, 0
+        with override_settings(SESSION_ENGINE=ENGINES[name]):
+            self.reads = self.writes = self.queries = 0
+            for user in users:
+                start = time.perf_counter()
+                steps, session_cookie = self.flow(Client(), user)
+                timings.append(time.perf_counter() - start)
+                requests += steps
+                cookie = max(cookie, len(session_cookie))
+            reads, writes, queries = self.reads, self.writes, self.queries
+
+        self.stdout.write(
+            f"{name:<16} {requests / flows:>8.1f} {queries / flows:>8.1f} {reads / flows:>10.1f} "
+            f"{writes / flows:>11.1f} {cookie:>8} {summary(timings)['mean_ms']:>8.2f}"
+        )
+
+    def flow(self, client, user):
+        steps = 0
+
+        def get(path, expect=200):
+            nonlocal steps
+            steps += 1
+            response = client.get(path)
+            if response.status_code != expect:
+                raise CommandError(f'GET {path}: {response.status_code}')
+            return response
+
+        def post(path, data):
+            nonlocal steps
+            steps += 1
+            response = client.post(path, data)
+            if response.status_code != 302:
+                raise CommandError(f'POST {path}: {response.status_code}')
+            return response
+
+        # Browse and fill a guest cart
+        get(reverse('home'))
+        for pk in self.product_ids[:3]:
+            get(reverse('product_detail', args=[pk]))
+        for pk in self.product_ids[:2]:
+            get(reverse('add_to_cart', args=[pk]), expect=302)
+        get(reverse('view_cart'))
+
+        # Log in (the guest cart is merged) and check out
+        get(reverse('login'))
+        post(reverse('login'), {'username': user.email, 'password': PASSWORD})
+        get(reverse('view_cart'))
+        get(reverse('checkout_cart'))
+        response = post(reverse('checkout_cart'), {
+            'street': '1 Bench St', 'city': 'Bench City', 'postal': '1000',
+            'first_name': user.first_name, 'last_name': user.last_name, 'username': user.username,
+            'email': user.email, 'phone': user.phone, 'payment_method': 'COD',
+        })
+        match = ORDER_SUMMARY.search(response['Location'])
+        if not match:
+            raise CommandError(f"Checkout didn't place an order: {response['Location']}")
+        get(reverse('order_summary', args=[match.group(1)]))
+
+        session_cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+        return steps, session_cookie.value if session_cookie else ''
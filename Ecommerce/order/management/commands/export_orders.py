@@ -0,0 +1,43 @@
+import time
+from datetime import date
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from order import export
+from order.models import Order
+
+
+class Command(BaseCommand):
+    help = ('Write orders with their items, payment and shipping as CSV or JSON lines, streamed in '
+            'constant memory. Dates are inclusive, in the shop time zone.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(export.WRITERS), default='csv')
+        parser.add_argument('--since', type=date.fromisoformat, help='First day, YYYY-MM-DD.')
+        parser.add_argument('--until', type=date.fromisoformat, help='Last day, YYYY-MM-DD.')
+        parser.add_argument('--status', nargs='+', choices=[value for value, _ in Order.ORDER_STATUS_CHOICES])
+        parser.add_argument('--output', '-o', help='File to write; standard output by default.')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['since'] and options['until'] and options['since'] > options['until']:
+            raise CommandError('--since is after --until.')
+
+        queryset = export.orders(options['since'], options['until'], options['status'])
+        chunks = export.WRITERS[options['format']](queryset, options['chunk_size'])
+        start, written = time.perf_counter(), 0
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else None
+        write = out.write if out else partial(self.stdout.write, ending='')
+        try:
+            for chunk in chunks:
+                write(chunk)
+                written += len(chunk)
+        finally:
+            if out:
+                out.close()
+
+        if out:
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written / 2 ** 20:.1f} MB to {options['output']} in {time.perf_counter() - start:.2f}s."
+            ))
@@ -0,0 +1,115 @@
+import tempfile, threading
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+
+from base.benchmark import test_database
+from base.models import Category, Customer, Product
+from order.models import (CanceledItem, CartItem, ConcurrentUpdateError, DeliveredItem, InvalidTransition,
+                          Order, OrderItem, Payment, ShoppingCart)
+
+
+class Command(BaseCommand):
+    help = ('Race cancel_order against marking the same order delivered from two threads and check '
+            'that exactly one of them wins and stock and history tables agree with the final status.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('race_order_status runs against SQLite only.')
+
+        with tempfile.TemporaryDirectory() as tmp, test_database(path=Path(tmp) / 'race_order_status.sqlite3'):
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+            connection.settings_dict['OPTIONS'] = {'timeout': 30, 'transaction_mode': 'IMMEDIATE'}
+
+            order_ids = self.setup_orders(options['orders'])
+            initial_stock = 10 * options['orders']
+            connection.close()
+
+            wins = {'cancel': 0, 'deliver': 0, 'both': 0, 'none': 0}
+            for order_id in order_ids:
+                winners = self.race(order_id)
+                if len(winners) == 1:
+                    wins[winners[0]] += 1
+                else:
+                    wins['both' if winners else 'none'] += 1
+
+            errors = self.verify(initial_stock)
+
+        self.stdout.write(
+            f"{options['orders']} races: cancel won {wins['cancel']}, deliver won {wins['deliver']}, "
+            f"both won {wins['both']}, none won {wins['none']}"
+        )
+        if wins['both'] or wins['none'] or errors:
+            raise CommandError('; '.join(errors) or 'Every race must have exactly one winner.')
+        self.stdout.write(self.style.SUCCESS('Exactly one winner per order; stock and history tables are consistent.'))
+
+    def setup_orders(self, count):
+        category = Category.objects.create(name='Bench')
+        product = Product.objects.create(name='Race Product', description='Race', price=100,
+                                         stock=10 * count, category=category)
+        user = Customer.objects.create(email='race@example.com', username='race', password='!')
+        cart = ShoppingCart.objects.create(user=user)
+        order_ids = []
+        for _ in range(count):
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+            order = Order.create_from_cart(user, CartItem.objects.filter(cart=cart), 'Race address',
+                                           Payment.GCASH, Payment.COMPLETED)
+            order_ids.append(order.pk)
+        return order_ids
+
+    def race(self, order_id):
+        barrier = threading.Barrier(2)
+        winners = []
+
+        def cancel():
+            order = Order.objects.get(pk=order_id)
+            barrier.wait()
+            try:
+                if order.cancel_order():
+                    winners.append('cancel')
+            except ConcurrentUpdateError:
+                pass
+            finally:
+                connections.close_all()
+
+        def deliver():
+            order = Order.objects.get(pk=order_id)
+            barrier.wait()
+            try:
+                with transaction.atomic():
+                    order.status = Order.DELIVERED
+                    order.save()
+                    order.move_to_delivered_items()
+                winners.append('deliver')
+            except (InvalidTransition, ConcurrentUpdateError):
+                pass
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=cancel), threading.Thread(target=deliver)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return winners
+
+    def verify(self, initial_stock):
+        errors = []
+        if DeliveredItem.objects.exclude(order__status=Order.DELIVERED).exists():
+            errors.append('delivered items for an order that is not delivered')
+        if CanceledItem.objects.exclude(order__status=Order.CANCELED).exists():
+            errors.append('canceled items for an order that is not canceled')
+        if Order.objects.filter(status=Order.DELIVERED, delivered_items__isnull=True).exists():
+            errors.append('delivered order without delivered items')
+        if Order.objects.filter(status=Order.CANCELED, canceled_items__isnull=True).exists():
+            errors.append('canceled order without canceled items')
+        sold = OrderItem.objects.exclude(order__status=Order.CANCELED).aggregate(units=Sum('quantity'))['units'] or 0
+        if Product.objects.get().stock + sold != initial_stock:
+            errors.append('stock does not match the units of orders that were not canceled')
+        return errors
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.models import Shipping
+
+
+class Command(BaseCommand):
+    help = ('Move every due shipment and its order to Shipped/Delivered with set-based updates. '
+            'Run it from cron, or pass --interval to keep it running.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Seconds between sweeps; 0 sweeps once and exits.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            counts = Shipping.sweep_statuses(chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f"Delivered {counts['delivered']}, shipped {counts['shipped']}, "
+                f"canceled {counts['canceled']} in {time.perf_counter() - start:.2f}s"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_remove_cartitem_size'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shipping',
+            name='shipping_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+# Repeated move_to_*_items calls left duplicate rows; keep the first one of each
+def remove_duplicates(apps, schema_editor):
+    for model_name in ('DeliveredItem', 'CanceledItem'):
+        model = apps.get_model('order', model_name)
+        keep = (model.objects.values('order_id', 'product_id')
+                .annotate(first_id=models.Min('id'))
+                .values('first_id'))
+        model.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_product_search_index'),
+        ('order', '0004_shipping_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='canceleditem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_canceled_item'),
+        ),
+        migrations.AddConstraint(
+            model_name='delivereditem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_delivered_item'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:39
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+# Fill the new cached subtotal for the carts that already exist
+def fill_subtotals(apps, schema_editor):
+    ShoppingCart = apps.get_model('order', 'ShoppingCart')
+    CartItem = apps.get_model('order', 'CartItem')
+    totals = (CartItem.objects.filter(cart=models.OuterRef('pk'))
+              .order_by().values('cart')
+              .annotate(total=models.Sum(models.F('quantity') * models.F('product__price'),
+                                         output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+              .values('total'))
+    ShoppingCart.objects.update(
+        subtotal=Coalesce(models.Subquery(totals), models.Value(Decimal('0')),
+                          output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_order_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_subtotals, migrations.RunPython.noop),
+    ]
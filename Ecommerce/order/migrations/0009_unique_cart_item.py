@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+# Concurrent add_to_cart calls could create the same line twice; fold the
+# duplicates into the first line of each (cart, product), adding up the quantities
+def merge_duplicates(apps, schema_editor):
+    CartItem = apps.get_model('order', 'CartItem')
+    duplicates = (CartItem.objects.values('cart_id', 'product_id')
+                  .annotate(first_id=models.Min('id'), total=models.Sum('quantity'), lines=models.Count('id'))
+                  .filter(lines__gt=1))
+    for row in duplicates:
+        CartItem.objects.filter(pk=row['first_id']).update(quantity=row['total'])
+        CartItem.objects.filter(cart_id=row['cart_id'], product_id=row['product_id']).exclude(pk=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_image_variants'),
+        ('order', '0008_cart_subtotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_item'),
+        ),
+    ]
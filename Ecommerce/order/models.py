@@ -1,8 +1,45 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from base.models import *
+from .state_machine import StatusMachineMixin, InvalidTransition, ConcurrentUpdateError
 # Create your models here.
+class InsufficientStock(ValueError):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Not enough stock for product(s): {', '.join(map(str, product_ids))}")
+
+
+def _quantity_case(quantities):
+    # CASE id WHEN .. THEN qty .. END, so every product is updated in the same statement
+    return models.Case(
+        *[models.When(pk=pk, then=models.Value(qty)) for pk, qty in quantities.items()],
+        output_field=models.PositiveIntegerField(),
+    )
+
+
+def reserve_stock(quantities):
+    # Take {product_id: quantity} out of Product.stock in one conditional UPDATE.
+    # All rows are checked and written by a single statement, so concurrent checkouts
+    # can't oversell and there is no lock ordering between products to deadlock on.
+    # Must run inside a transaction: if any product is short, nothing is reserved.
+    if not quantities:
+        return
+    qty = _quantity_case(quantities)
+    updated = Product.objects.filter(pk__in=quantities, stock__gte=qty).update(stock=models.F('stock') - qty)
+    if updated != len(quantities):
+        short = Product.objects.filter(pk__in=quantities, stock__lt=_quantity_case(quantities))
+        raise InsufficientStock(sorted(short.values_list('pk', flat=True)))
+
+
+def release_stock(quantities):
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(stock=models.F('stock') + _quantity_case(quantities))
+
+
 # Order Model
-class Order(models.Model):
+class Order(StatusMachineMixin):
     PENDING = 'PENDING'
     SHIPPED = 'SHIPPED'
     DELIVERED = 'DELIVERED'
@@ -15,6 +52,13 @@ class Order(models.Model):
         (CANCELED, 'Canceled'),
     ]
 
+    # A delivered or canceled order can't change anymore: canceling a delivered order
+    # would put goods the customer already has back into stock
+    STATUS_TRANSITIONS = {
+        PENDING: {SHIPPED, DELIVERED, CANCELED},
+        SHIPPED: {DELIVERED, CANCELED},
+    }
+
     user = models.ForeignKey(Customer, related_name='orders', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=ORDER_STATUS_CHOICES, default=PENDING)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -23,12 +67,33 @@ class Order(models.Model):
 
     def __str__(self):
         return f"Order #{self.id} - {self.status}"
+
+    class Meta:
+        # Keyset pagination of a customer's orders by (created_at, id), see order/pagination.py
+        indexes = [
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_created'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created'),
+            # Date range scans of the sales summary refresh (order/analytics.py)
+            models.Index(fields=['created_at'], name='order_created'),
+        ]
     
     def cancel_order(self):
-        if self.status != Order.CANCELED:
-            # Update order status
-            self.status = Order.CANCELED
-            self.save()
+        with transaction.atomic():
+            # Conditional update on the loaded version: only the request that actually
+            # cancels the order gets here, so reserved stock is released exactly once, and
+            # an order delivered in the meantime is not canceled behind the deliverer's back
+            if not self.can_transition(Order.CANCELED):
+                return False
+            canceled = Order.objects.filter(pk=self.pk, version=self.version).exclude(status=Order.CANCELED).update(
+                status=Order.CANCELED, version=models.F('version') + 1,
+            )
+            if not canceled:
+                return False  # Already canceled or changed by someone else, no changes made
+            self.status = self._loaded_status = Order.CANCELED
+            self.version += 1
+
+            # Put the reserved stock back
+            release_stock(self.item_quantities())
 
             # Cancel payment if it exists
             if hasattr(self, 'payment'):
@@ -41,8 +106,51 @@ class Order(models.Model):
             # Move items to canceled items
             self.move_to_canceled_items()
 
-            return True  # Indicate success
-        return False  # Already canceled, no changes made
+        return True  # Indicate success
+
+    @classmethod
+    def bulk_transition(cls, queryset, status, chunk_size=1000):
+        # Move every order of the queryset that may go to `status` there with set-based
+        # updates (the order admin actions), chunk by chunk, doing for each chunk what
+        # sweep_statuses() and cancel_order() do: shipping, payment, stock and item history.
+        # Returns the number of orders moved; the others are left as they are. The sources
+        # come from STATUS_TRANSITIONS, so delivered orders are never canceled (and restocked).
+        sources = [source for source, targets in cls.STATUS_TRANSITIONS.items() if status in targets]
+        shipping_status = {cls.SHIPPED: 'Shipped', cls.DELIVERED: 'Delivered', cls.CANCELED: 'Canceled'}[status]
+        shipping_sources = [source for source, targets in Shipping.STATUS_TRANSITIONS.items()
+                            if shipping_status in targets]
+        due = queryset.filter(status__in=sources).order_by('pk').values_list('pk', flat=True)
+        bump = models.F('version') + 1
+        moved = 0
+        while True:
+            with transaction.atomic():
+                # Moved orders leave `due`, so the next chunk is again at the start
+                order_ids = list(due.select_for_update()[:chunk_size])
+                if not order_ids:
+                    break
+                cls.objects.filter(pk__in=order_ids).update(status=status, version=bump)
+                Shipping.objects.filter(order_id__in=order_ids, shipping_status__in=shipping_sources).update(
+                    shipping_status=shipping_status, version=bump,
+                )
+                if status == cls.DELIVERED:
+                    copy_order_items(DeliveredItem, order_ids)
+                elif status == cls.CANCELED:
+                    quantities = dict(OrderItem.objects.filter(order_id__in=order_ids).values('product_id')
+                                      .annotate(units=models.Sum('quantity')).values_list('product_id', 'units')
+                                      .order_by())
+                    release_stock(quantities)
+                    Payment.objects.filter(order_id__in=order_ids).exclude(payment_status=Payment.FAILED).update(
+                        payment_status=Payment.FAILED, version=bump,
+                    )
+                    copy_order_items(CanceledItem, order_ids)
+            moved += len(order_ids)
+        return moved
+
+    def item_quantities(self):
+        quantities = {}
+        for product_id, quantity in self.items.values_list('product_id', 'quantity'):
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return quantities
 
     def update_total(self):
         self.total_price = sum(item.total_price() for item in self.items.all())
@@ -70,41 +178,66 @@ class Order(models.Model):
             tracking_number = random_string,
         )
 
-        # Update order status to 'Shipped'
-        self.status = Order.PENDING
-        self.save()
-
+        # The order stays 'PENDING' (checked above) until the shipping date comes closer
         return shipping
     
-    def move_to_delivered_items(self):
-        # Ensure the order is marked as delivered
-        if self.status == Order.DELIVERED:
-            for item in self.items.all():
-                DeliveredItem.objects.create(
-                    order=self,
+    @classmethod
+    def create_from_cart(cls, user, cart_items, shipping_address, payment_method, payment_status):
+        # Turn the given cart items into one order inside a single transaction.
+        # The number of queries is the same for 1 or 100 items.
+        with transaction.atomic():
+            items = list(cart_items.select_related('product'))
+            if not items:
+                return None
+
+            # Reserve the stock first; raises InsufficientStock and rolls back if any product is short
+            quantities = {}
+            for item in items:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+            reserve_stock(quantities)
+
+            total_price = cart_items.aggregate(
+                total=models.Sum(models.F('quantity') * models.F('product__price'))
+            )['total']
+
+            order = cls.objects.create(
+                user=user,
+                status=cls.PENDING,
+                total_price=total_price,
+                shipping_address=shipping_address,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
                     product=item.product,
                     quantity=item.quantity,
-                    price=item.price,
+                    price=item.product.price,
                 )
+                for item in items
+            ])
+            Payment.objects.create(
+                order=order,
+                payment_method=payment_method,
+                payment_status=payment_status,
+            )
+            order.set_random_delivery_date()
 
-    def move_to_canceled_items(self):
+            # Clear the checked out items from the cart
+            CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+            ShoppingCart.update_subtotals({item.cart_id for item in items})
+
+        return order
+
+    def move_to_delivered_items(self):
         # Ensure the order is marked as delivered
+        if self.status == Order.DELIVERED:
+            copy_order_items(DeliveredItem, [self.pk])
+
+    def move_to_canceled_items(self):
+        # Ensure the order is marked as canceled
         if self.status == Order.CANCELED:
-            for item in self.items.all():
-                CanceledItem.objects.create(
-                    order=self,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price=item.price,
-                )
-                
-    def save(self, *args, **kwargs):
-        # Prevent status changes if the order is already canceled
-        if self.pk and self.status == self.CANCELED:
-            original_status = Order.objects.get(pk=self.pk).status
-            if original_status == self.CANCELED and self.status != self.CANCELED:
-                raise ValueError("Cannot change the status of a canceled order.")
-        super().save(*args, **kwargs)
+            copy_order_items(CanceledItem, [self.pk])
+
 
 # OrderItem Model (links Order and Product)
 class OrderItem(models.Model):
@@ -121,8 +254,19 @@ class OrderItem(models.Model):
 
 
 # ShoppingCart Model (for saving user cart before checkout)
+# quantity * unit price of one cart line, computed by the database
+CART_LINE_TOTAL = models.ExpressionWrapper(
+    models.F('quantity') * models.F('product__price'),
+    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+)
+
+
 class ShoppingCart(models.Model):
     user = models.OneToOneField(Customer, related_name='cart', on_delete=models.CASCADE)
+    # Cached sum of the cart lines, shown as the cart page total. Everything that writes cart
+    # lines or product prices refreshes it with update_subtotals(): the cart views, checkout,
+    # the guest cart merge, CartItemAdmin, the Product signals and import_catalog.
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -130,7 +274,29 @@ class ShoppingCart(models.Model):
         return f"Cart for {self.user.username}"
 
     def get_total_price(self):
-        return sum(item.total_price() for item in self.items.all())
+        return self.items.aggregate(total=models.Sum(CART_LINE_TOTAL))['total'] or Decimal('0')
+
+    @staticmethod
+    def lines_for(user):
+        # The cart lines of a user with their product, line_total and cart_total (the
+        # cart's cached subtotal, from the join the filter already makes), all in one query
+        return (CartItem.objects.filter(cart__user=user)
+                .select_related('product')
+                .annotate(line_total=CART_LINE_TOTAL, cart_total=models.F('cart__subtotal'))
+                .order_by('pk'))
+
+    @classmethod
+    def update_subtotals(cls, carts):
+        # Recompute the cached subtotal of the given carts (ids or a values('cart') queryset)
+        # in one UPDATE with a correlated subquery
+        totals = (CartItem.objects.filter(cart=models.OuterRef('pk'))
+                  .order_by().values('cart')
+                  .annotate(total=models.Sum(CART_LINE_TOTAL))
+                  .values('total'))
+        return cls.objects.filter(pk__in=carts).update(
+            subtotal=Coalesce(models.Subquery(totals), models.Value(Decimal('0')),
+                              output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )
 
 
 # CartItem Model (links Product and ShoppingCart)
@@ -140,17 +306,23 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name} (Size: {self.size.size})"
+        return f"{self.quantity} x {self.product.name}"
 
     def total_price(self):
         quantity = self.quantity if self.quantity is not None else 0
         price = self.product.price if self.product.price is not None else 0
         return quantity * price
 
+    class Meta:
+        constraints = [
+            # One line per product; the guest cart merge upserts on it
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_item'),
+        ]
+
 
 
 # Payment Model
-class Payment(models.Model):
+class Payment(StatusMachineMixin):
     CASH_ON_DELIVERY = 'Cash on Delivery'
     PAYPAL = 'PayPal'
     GCASH = 'GCash'
@@ -173,6 +345,13 @@ class Payment(models.Model):
         (FAILED, 'Failed'),
     ]
 
+    # A failed payment (after cancellation) can't change anymore
+    status_field = 'payment_status'
+    STATUS_TRANSITIONS = {
+        PENDING: {COMPLETED, FAILED},
+        COMPLETED: {FAILED},
+    }
+
     order = models.OneToOneField(Order, related_name='payment', on_delete=models.CASCADE)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, default=CASH_ON_DELIVERY)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default=PENDING)
@@ -180,61 +359,71 @@ class Payment(models.Model):
     transaction_id = models.CharField(max_length=255, null=True, blank=True)
 
     def __str__(self):
-        return f"Payment for Order #{self.order.id} - {self.payment_status}"
+        return f"Payment for Order #{self.order_id} - {self.payment_status}"
     
-    def save(self, *args, **kwargs):
-        # Prevent status changes if the payment is failed (after cancellation)
-        if self.pk and self.payment_status == Payment.FAILED:
-            original_status = Payment.objects.get(pk=self.pk).payment_status
-            if original_status == Payment.FAILED and self.payment_status != Payment.FAILED:
-                raise ValueError("Cannot change the status of a failed payment.")
-        super().save(*args, **kwargs)
-
     def cancel_payment(self):
         self.payment_status = Payment.FAILED
         self.save()
 
 
 # Shipping Model
-class Shipping(models.Model):
+class Shipping(StatusMachineMixin):
+    # A delivered or canceled shipping can't change anymore, like its order
+    status_field = 'shipping_status'
+    STATUS_TRANSITIONS = {
+        'Not Shipped': {'Shipped', 'Delivered', 'Canceled'},
+        'Shipped': {'Delivered', 'Canceled'},
+    }
+
     order = models.OneToOneField(Order, related_name='shipping', on_delete=models.CASCADE)
     shipping_method = models.CharField(max_length=255)
     shipping_status = models.CharField(max_length=50, default='Not Shipped')
     tracking_number = models.CharField(max_length=255, null=True, blank=True)
-    shipping_date = models.DateTimeField(null=True, blank=True)
+    shipping_date = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
-        return f"Shipping for Order #{self.order.id} - {self.shipping_status}"
-
-    def update_shipping_status(self):
-        # Get today's date and the shipping date
-        today = now().date()
-        shipping_date = self.shipping_date.date() if self.shipping_date else None
-
-        if self.order.status != Order.CANCELED:
-            if shipping_date <= today:
-                self.shipping_status = 'Delivered'
-                self.order.status = Order.DELIVERED
-            elif today >= shipping_date - timedelta(days=3):
-                self.shipping_status = 'Shipped'
-                self.order.status = Order.SHIPPED
-            else:
-                self.shipping_status = 'Not Shipped'
-                self.order.status = Order.PENDING
-        else:
-            self.shipping_status = 'Canceled'
-            self.order.status = Order.CANCELED
-
-        self.order.save()
-        self.save()
-
-    def save(self, *args, **kwargs):
-        # Prevent status changes if the shipping is canceled
-        if self.pk and self.shipping_status == 'Canceled':
-            original_status = Shipping.objects.get(pk=self.pk).shipping_status
-            if original_status == 'Canceled' and self.shipping_status != 'Canceled':
-                raise ValueError("Cannot change the status of a canceled shipping.")
-        super().save(*args, **kwargs)
+        return f"Shipping for Order #{self.order_id} - {self.shipping_status}"
+
+    @classmethod
+    def sweep_statuses(cls, chunk_size=1000):
+        # Move every shipment (and its order) forward by its shipping date at once, run
+        # by the sweep_shipping command so the order status page doesn't have to write.
+        midnight = now().replace(hour=0, minute=0, second=0, microsecond=0)
+        deliver_before = midnight + timedelta(days=1)  # shipping date is today or earlier
+        ship_before = midnight + timedelta(days=4)  # shipping date within the next 3 days
+        counts = {'delivered': 0, 'shipped': 0, 'canceled': 0}
+        bump = models.F('version') + 1
+
+        # Delivered: chunked, because the items also move to DeliveredItem
+        due = Order.objects.filter(
+            status__in=[Order.PENDING, Order.SHIPPED],
+            shipping__shipping_date__lt=deliver_before,
+        ).order_by('pk').values_list('pk', flat=True)
+        while True:
+            with transaction.atomic():
+                order_ids = list(due[:chunk_size])
+                if not order_ids:
+                    break
+                Order.objects.filter(pk__in=order_ids).update(status=Order.DELIVERED, version=bump)
+                cls.objects.filter(order_id__in=order_ids).update(shipping_status='Delivered', version=bump)
+                copy_order_items(DeliveredItem, order_ids)
+            counts['delivered'] += len(order_ids)
+
+        # Shipped
+        with transaction.atomic():
+            cls.objects.filter(
+                order__status=Order.PENDING, shipping_date__lt=ship_before,
+            ).update(shipping_status='Shipped', version=bump)
+            counts['shipped'] = Order.objects.filter(
+                status=Order.PENDING, shipping__shipping_date__lt=ship_before,
+            ).update(status=Order.SHIPPED, version=bump)
+
+        # Canceled orders whose shipping wasn't canceled yet
+        counts['canceled'] = cls.objects.filter(
+            order__status=Order.CANCELED,
+        ).exclude(shipping_status='Canceled').update(shipping_status='Canceled', version=bump)
+
+        return counts
 
     def cancel_shipping(self):
         self.shipping_status = 'Canceled'
@@ -248,6 +437,11 @@ class DeliveredItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Delivered)"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_delivered_item'),
+        ]
     
 class CanceledItem(models.Model):
     order = models.ForeignKey(Order, related_name='canceled_items', on_delete=models.CASCADE)
@@ -257,3 +451,75 @@ class CanceledItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Canceled)"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_canceled_item'),
+        ]
+
+
+def copy_order_items(model, order_ids):
+    # Copy the items of the given orders into DeliveredItem or CanceledItem with one
+    # INSERT. There is one row per (order, product) and existing rows are skipped,
+    # so calling this again for the same orders is a no-op.
+    rows = (OrderItem.objects.filter(order_id__in=order_ids)
+            .values('order_id', 'product_id')
+            .annotate(units=models.Sum('quantity'), unit_price=models.Max('price'))
+            .order_by())
+    return model.objects.bulk_create([
+        model(order_id=row['order_id'], product_id=row['product_id'],
+              quantity=row['units'], price=row['unit_price'])
+        for row in rows
+    ], ignore_conflicts=True)
+
+
+# Daily sales summaries, refreshed by the refresh_sales_summary command (order/analytics.py)
+# and read by the staff sales dashboard. Per day (in TIME_ZONE) of the order's created_at:
+# units and revenue of the orders that weren't canceled, and the same for the canceled ones.
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    canceled_units = models.PositiveIntegerField(default=0)
+    canceled_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_daily_product_sales'),
+        ]
+
+
+class DailyCategorySales(models.Model):
+    day = models.DateField()
+    category = models.ForeignKey(Category, related_name='daily_sales', on_delete=models.CASCADE)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    canceled_units = models.PositiveIntegerField(default=0)
+    canceled_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_daily_category_sales'),
+        ]
+
+
+class DailyPaymentSales(models.Model):
+    day = models.DateField()
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHOD_CHOICES)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    canceled_orders = models.PositiveIntegerField(default=0)
+    canceled_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'payment_method'], name='unique_daily_payment_sales'),
+        ]
+
+
+class SummaryState(models.Model):
+    # High-water mark of a summary: the newest Order.created_at it has seen
+    name = models.CharField(max_length=50, unique=True)
+    high_water = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
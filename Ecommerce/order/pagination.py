@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# Keyset ("seek") pagination over (created_at, id), newest first.
+# Every page is one indexed range query no matter how deep the customer scrolls,
+# unlike OFFSET which reads and throws away all the rows before the page.
+# The cursor is "<created_at in microseconds since the epoch>-<id>" of the last row shown.
+
+def encode_cursor(obj):
+    return f'{(obj.created_at - EPOCH) // timedelta(microseconds=1)}-{obj.pk}'
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.split('-')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, per_page=20):
+    queryset = queryset.order_by('-created_at', '-id')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
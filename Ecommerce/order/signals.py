@@ -0,0 +1,34 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from base.models import Product
+from .models import CartItem, ShoppingCart
+from .context_processor import invalidate_cart_count
+from . import guestcart
+
+
+# Keep the cached cart subtotals right when a product's price changes or it is removed
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    if not created and (update_fields is None or 'price' in update_fields):
+        ShoppingCart.update_subtotals(CartItem.objects.filter(product=instance).values('cart'))
+
+
+@receiver(pre_delete, sender=Product)
+def remember_carts(sender, instance, **kwargs):
+    # The cart lines are gone by post_delete, so note which carts held the product first
+    instance._cart_ids = list(CartItem.objects.filter(product=instance).values_list('cart', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def product_removed(sender, instance, **kwargs):
+    cart_ids = getattr(instance, '_cart_ids', None)
+    if cart_ids:
+        ShoppingCart.update_subtotals(cart_ids)
+
+
+# Move the guest cart from the session into the customer's cart when they log in
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session') and guestcart.merge(user, request.session):
+        invalidate_cart_count(user.pk)
@@ -0,0 +1,68 @@
+from django.db import DatabaseError, models
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+class ConcurrentUpdateError(DatabaseError):
+    pass
+
+
+# Shared by Order, Payment and Shipping.
+# - The status read from the database is remembered in from_db(), so save() can check
+#   the transition in memory instead of re-reading the row first.
+# - Every UPDATE is made conditional on the version the instance was loaded with
+#   (optimistic locking): if someone else saved the row in between, save() raises
+#   ConcurrentUpdateError instead of silently overwriting their change.
+# Set-based updates of these tables should bump the version too: version=F('version') + 1
+class StatusMachineMixin(models.Model):
+    version = models.PositiveIntegerField(default=0)
+
+    status_field = 'status'
+    STATUS_TRANSITIONS = {}  # status -> statuses it may move to
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get(cls.status_field)
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_status = self.__dict__.get(self.status_field)
+
+    def can_transition(self, status):
+        current = getattr(self, '_loaded_status', None)
+        return current is None or current == status or status in self.STATUS_TRANSITIONS.get(current, ())
+
+    def save(self, *args, **kwargs):
+        status = getattr(self, self.status_field)
+        if not self._state.adding and not self.can_transition(status):
+            raise InvalidTransition(
+                f"Cannot change the status of {self._meta.verbose_name} #{self.pk} "
+                f"from {self._loaded_status} to {status}."
+            )
+        super().save(*args, **kwargs)
+        self._loaded_status = status
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update, *args, **kwargs):
+        if self._state.adding:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update, *args, **kwargs)
+
+        version = self._meta.get_field('version')
+        values = [value for value in values if value[0] is not version]
+        values.append((version, None, self.version + 1))
+        updated = super()._do_update(
+            base_qs.filter(version=self.version), using, pk_val, values, update_fields, forced_update,
+            *args, **kwargs
+        )
+        if not updated:
+            raise ConcurrentUpdateError(
+                f"{self._meta.verbose_name} #{pk_val} was changed by someone else; reload it and try again."
+            )
+        self.version += 1
+        return updated
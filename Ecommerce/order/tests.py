@@ -1,3 +1,590 @@
-from django.test import TestCase
+import io, threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from base.models import Category, Customer, Product
+from . import analytics, export, guestcart
+from .context_processor import aget_cart_count, cart_count, cart_count_key, get_cart_count
+from .pagination import encode_cursor
+from .models import (CanceledItem, CartItem, ConcurrentUpdateError, DailyCategorySales, DailyPaymentSales,
+                     DailyProductSales, DeliveredItem, InsufficientStock, InvalidTransition, Order, OrderItem,
+                     Payment, Shipping, ShoppingCart, SummaryState)
+
+
+def make_product(name='Test Shoe', price=100, stock=10, category=None):
+    category = category or Category.objects.create(name='Test Brand')
+    return Product.objects.create(name=name, description='Test product', price=price, stock=stock,
+                                  category=category)
+
+
+def make_customer(name='customer'):
+    return Customer.objects.create(email=f'{name}@example.com', username=name, password='!')
+
+
+class CartCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_customer()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def fill_cart(self, lines):
+        cart = ShoppingCart.objects.create(user=self.user)
+        category = Category.objects.create(name='Cart Brand')
+        for i in range(lines):
+            CartItem.objects.create(cart=cart, product=make_product(f'Shoe {i}', category=category))
+
+    def test_warm_cache_runs_no_query(self):
+        self.fill_cart(3)
+        get_cart_count(self.request, self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_count(self.request, self.user), 3)
+
+    def test_cache_miss_runs_one_query(self):
+        self.fill_cart(2)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cart_count(self.request, self.user), 2)
+        self.assertEqual(cache.get(cart_count_key(self.user.pk)), 2)
+
+    def test_user_without_cart(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cart_count(self.request, self.user), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_count(self.request, self.user), 0)
+
+    def test_async_badge_reads_the_same_cache(self):
+        self.fill_cart(2)
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(aget_cart_count)(self.request, self.user), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_count(self.request, self.user), 2)
+            self.assertEqual(async_to_sync(aget_cart_count)(self.request, self.user), 2)
+
+    def test_context_processor_is_lazy(self):
+        with self.assertNumQueries(0):
+            context = cart_count(self.request)
+        with self.assertNumQueries(1):
+            self.assertEqual(str(context['cart_count']), '0')  # as the template renders it
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Test Brand')
+        self.shoe = make_product('Shoe', category=category)
+        self.boot = make_product('Boot', category=category)
+        self.user = Customer.objects.create_user('guest@example.com', 'secret', username='guest')
+
+    def add(self, product, quantity):
+        return self.client.get(reverse('add_to_cart', args=[product.pk]), {'quantity': quantity})
+
+    def login(self):
+        response = self.client.post(reverse('login'), {'username': 'guest@example.com', 'password': 'secret'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def cart_rows(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product__name', 'quantity'))
+
+    def test_merged_at_login(self):
+        cart = ShoppingCart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.shoe, quantity=3)
+        self.add(self.shoe, 2)
+        self.add(self.shoe, 1)
+        self.add(self.boot, 1)
+        self.login()
+        self.assertEqual(self.cart_rows(), {'Shoe': 6, 'Boot': 1})
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, 700)
+        self.assertNotIn(guestcart.SESSION_KEY, self.client.session)
+
+    def test_invalid_quantity_is_rejected(self):
+        for quantity in (0, -2, 'two'):
+            response = self.add(self.shoe, quantity)
+            self.assertRedirects(response, reverse('product_detail', args=[self.shoe.pk]),
+                                 fetch_redirect_response=False)
+        self.assertNotIn(guestcart.SESSION_KEY, self.client.session)
+        with self.assertRaises(ValueError):
+            guestcart.add({}, self.shoe.pk, 0)
+        self.login()
+        self.assertEqual(self.cart_rows(), {})
+
+    def test_merge_skips_lines_that_are_not_positive(self):
+        # A cart saved before add() checked the quantity
+        session = {guestcart.SESSION_KEY: {str(self.shoe.pk): -5, str(self.boot.pk): 2}}
+        guestcart.merge(self.user, session)
+        self.assertEqual(self.cart_rows(), {'Boot': 2})
+        self.assertEqual(session, {})
+
+
+def run_threads(targets):
+    # Each target in its own thread with its own connection, closed by the thread itself
+    errors = []
+
+    def run(target):
+        try:
+            target()
+        except Exception as error:  # reported by the test, not lost in the thread
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    # Real transactions and one connection per thread: reserve_stock()'s conditional UPDATE
+    # must not sell more than the stock however the checkouts interleave
+    STOCK = 20
+    CUSTOMERS = 40
+    THREADS = 8
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        self.product = make_product(stock=self.STOCK)
+        self.users = [make_customer(f'buyer{i}') for i in range(self.CUSTOMERS)]
+        for user in self.users:
+            cart = ShoppingCart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+
+    def test_no_oversell(self):
+        results = {'placed': 0, 'rejected': 0}
+        lock = threading.Lock()
+
+        def checkout(users):
+            for user in users:
+                try:
+                    Order.create_from_cart(user, CartItem.objects.filter(cart__user=user), 'Test address',
+                                           Payment.GCASH, Payment.COMPLETED)
+                    outcome = 'placed'
+                except InsufficientStock:
+                    outcome = 'rejected'
+                with lock:
+                    results[outcome] += 1
+
+        errors = run_threads([partial(checkout, self.users[i::self.THREADS]) for i in range(self.THREADS)])
+        self.assertEqual(errors, [])
+
+        self.product.refresh_from_db()
+        self.assertGreaterEqual(self.product.stock, 0)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+        self.assertEqual(results, {'placed': self.STOCK, 'rejected': self.CUSTOMERS - self.STOCK})
+        self.assertEqual(OrderItem.objects.aggregate(units=Sum('quantity'))['units'], self.STOCK)
+
+
+def place_order(user, product, quantity=1):
+    cart, _ = ShoppingCart.objects.get_or_create(user=user)
+    CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    return Order.create_from_cart(user, CartItem.objects.filter(cart=cart), 'Test address',
+                                  Payment.GCASH, Payment.COMPLETED)
+
+
+def deliver(order):
+    with transaction.atomic():
+        order.status = Order.DELIVERED
+        order.save()
+        order.move_to_delivered_items()
+
+
+class OrderStatusTests(TestCase):
+    def setUp(self):
+        self.product = make_product(stock=10)
+        self.order = place_order(make_customer(), self.product, quantity=2)
+
+    def test_cancel_releases_stock(self):
+        self.assertTrue(self.order.cancel_order())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertEqual(self.order.canceled_items.count(), 1)
+
+    def test_delivered_order_cannot_be_canceled(self):
+        deliver(self.order)
+        self.assertFalse(self.order.cancel_order())
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, Order.DELIVERED)
+        self.assertEqual(self.product.stock, 8)
+        self.assertFalse(self.order.canceled_items.exists())
+        self.assertEqual(self.order.delivered_items.count(), 1)
+
+    def test_canceled_order_cannot_be_delivered(self):
+        self.order.cancel_order()
+        with self.assertRaises(InvalidTransition):
+            deliver(self.order)
+
+
+class OrderStatusPageTests(TestCase):
+    def test_query_count_does_not_grow_with_items(self):
+        user = make_customer()
+        category = Category.objects.create(name='Status Brand')
+        queries = []
+        for lines in (1, 5):
+            cart, _ = ShoppingCart.objects.get_or_create(user=user)
+            for i in range(lines):
+                CartItem.objects.create(cart=cart, product=Product.objects.create(
+                    name=f'Shoe {lines}-{i}', description='Test product', price=100, stock=10,
+                    image='images/products/AIRJORDAN11RETROLOW.png', category=category))
+            order = Order.create_from_cart(user, CartItem.objects.filter(cart=cart), 'Test address',
+                                           Payment.GCASH, Payment.COMPLETED)
+            self.client.force_login(user)
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(reverse('order_status', args=[order.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, f'Shoe {lines}-{lines - 1}')
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+
+
+class BulkTransitionTests(TestCase):
+    # The order admin's status actions
+    def setUp(self):
+        self.product = make_product(stock=100)
+        user = make_customer()
+        self.pending, self.shipped, self.delivered = (place_order(user, self.product, quantity=5) for _ in range(3))
+        Order.bulk_transition(Order.objects.filter(pk=self.shipped.pk), Order.SHIPPED)
+        Order.bulk_transition(Order.objects.filter(pk=self.delivered.pk), Order.DELIVERED)
+
+    def test_cancel_leaves_delivered_orders_alone(self):
+        self.assertEqual(Order.bulk_transition(Order.objects.all(), Order.CANCELED), 2)
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {self.pending.pk: Order.CANCELED, self.shipped.pk: Order.CANCELED,
+                                    self.delivered.pk: Order.DELIVERED})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 95)  # only the canceled orders' units came back
+        self.assertFalse(CanceledItem.objects.filter(order=self.delivered).exists())
+        self.assertEqual(Payment.objects.get(order=self.delivered).payment_status, Payment.COMPLETED)
+
+    def test_deliver(self):
+        self.assertEqual(Order.bulk_transition(Order.objects.all(), Order.DELIVERED), 2)
+        self.assertEqual(DeliveredItem.objects.filter(order=self.delivered).count(), 1)
+        self.assertFalse(Order.objects.exclude(status=Order.DELIVERED).exists())
+
+    def test_shipping_admin(self):
+        # The change form can't move the status (a 500 on a transition it doesn't allow); the actions do
+        self.client.force_login(Customer.objects.create_superuser(email='admin@example.com', password='x'))
+        shipping = self.delivered.shipping
+        response = self.client.post(reverse('admin:order_shipping_change', args=[shipping.pk]), {
+            'order': self.delivered.pk, 'shipping_method': 'Courier', 'shipping_status': 'Canceled', 'version': 0,
+        })
+        self.assertRedirects(response, reverse('admin:order_shipping_changelist'))
+        shipping.refresh_from_db()
+        self.assertEqual((shipping.shipping_method, shipping.shipping_status), ('Courier', 'Delivered'))
+
+        self.client.post(reverse('admin:order_shipping_changelist'), {
+            'action': 'mark_shipped', '_selected_action': [self.pending.shipping.pk],
+        })
+        self.pending.refresh_from_db()
+        self.assertEqual((self.pending.status, self.pending.shipping.shipping_status), (Order.SHIPPED, 'Shipped'))
+
+
+class CancelDeliverRaceTests(TransactionTestCase):
+    # cancel_order() against marking the same order delivered, both starting from the same
+    # loaded version: exactly one may win, and stock and history must follow the winner
+    ORDERS = 20
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        self.product = make_product(stock=10 * self.ORDERS)
+        user = make_customer()
+        self.order_ids = [place_order(user, self.product, quantity=2).pk for _ in range(self.ORDERS)]
+
+    def race(self, order_id):
+        barrier = threading.Barrier(2)
+        winners = []
+
+        def cancel():
+            order = Order.objects.get(pk=order_id)
+            barrier.wait()
+            try:
+                if order.cancel_order():
+                    winners.append('cancel')
+            except ConcurrentUpdateError:
+                pass
+
+        def mark_delivered():
+            order = Order.objects.get(pk=order_id)
+            barrier.wait()
+            try:
+                deliver(order)
+                winners.append('deliver')
+            except (InvalidTransition, ConcurrentUpdateError):
+                pass
+
+        self.assertEqual(run_threads([cancel, mark_delivered]), [])
+        return winners
+
+    def test_one_winner_per_order(self):
+        for order_id in self.order_ids:
+            winners = self.race(order_id)
+            self.assertEqual(len(winners), 1, f'order {order_id}: {winners}')
+
+        self.assertFalse(DeliveredItem.objects.exclude(order__status=Order.DELIVERED).exists())
+        self.assertFalse(CanceledItem.objects.exclude(order__status=Order.CANCELED).exists())
+        self.assertFalse(Order.objects.filter(status=Order.DELIVERED, delivered_items__isnull=True).exists())
+        self.assertFalse(Order.objects.filter(status=Order.CANCELED, canceled_items__isnull=True).exists())
+        sold = OrderItem.objects.exclude(order__status=Order.CANCELED).aggregate(units=Sum('quantity'))['units'] or 0
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock + sold, 10 * self.ORDERS)
+
+
+ORDERS_CONTEXT = {'order_list': 'orders', 'delivered_items': 'delivered_orders', 'canceled_items': 'canceled_orders'}
+
+
+class OrderPageQueryTests(TestCase):
+    # The order list and purchase history pages run the same number of queries for a
+    # customer with 10 orders per status as for one with 10,000 (keyset pages, shipping
+    # joined, items prefetched); manage.py bench_order_pages times them
+    COUNTS = (10, 1000, 10000)
+    PAGES = {'order_list': Order.PENDING, 'delivered_items': Order.DELIVERED, 'canceled_items': Order.CANCELED}
+    QUERIES = {'order_list': 3, 'delivered_items': 4, 'canceled_items': 4}
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Test Brand')
+        products = Product.objects.bulk_create([
+            Product(name=f'Shoe {i}', description='Test product', price=100, stock=100,
+                    image='images/products/AIRJORDAN11RETROLOW.png', category=category)
+            for i in range(2)
+        ])
+        cls.users = {}
+        for count in cls.COUNTS:
+            cls.users[count] = user = make_customer(f'customer{count}')
+            for status in cls.PAGES.values():
+                orders = Order.objects.bulk_create([
+                    Order(user=user, status=status, total_price=Decimal(200), shipping_address='Test address')
+                    for _ in range(count)
+                ])
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product=product, quantity=1, price=product.price)
+                    for order in orders for product in products
+                ])
+                Shipping.objects.bulk_create([
+                    Shipping(order=order, shipping_method='Standard', shipping_status='Delivered') for order in orders
+                ])
+
+    def login(self, user):
+        self.client.force_login(user)
+        cache.clear()  # the badge and the context processors miss the cache
+
+    def test_query_count_does_not_grow_with_orders(self):
+        for count in self.COUNTS:
+            for name, queries in self.QUERIES.items():
+                with self.subTest(orders=count, page=name):
+                    self.login(self.users[count])
+                    with self.assertNumQueries(queries):
+                        response = self.client.get(reverse(name))
+                    self.assertEqual(response.status_code, 200)
+
+    def test_next_page(self):
+        user = self.users[10000]
+        for name, status in self.PAGES.items():
+            with self.subTest(page=name):
+                self.login(user)
+                first = self.client.get(reverse(name)).context
+                self.login(user)
+                with self.assertNumQueries(self.QUERIES[name]):
+                    second = self.client.get(reverse(name), {'after': first['next_cursor']}).context
+                key = ORDERS_CONTEXT[name]
+                expected = list(Order.objects.filter(user=user, status=status).order_by('-created_at', '-id')[:40])
+                self.assertEqual(list(first[key]) + list(second[key]), expected)
+                self.assertEqual(first['next_cursor'], encode_cursor(expected[19]))
+                self.assertEqual(second['next_cursor'], encode_cursor(expected[39]))
+
+    def test_last_page(self):
+        user = self.users[1000]
+        oldest = list(Order.objects.filter(user=user, status=Order.PENDING).order_by('created_at', 'id')[:4])
+        # The cursor of the fourth oldest order leaves three for the last page
+        self.login(user)
+        context = self.client.get(reverse('order_list'), {'after': encode_cursor(oldest[3])}).context
+        self.assertEqual(list(context['orders']), oldest[2::-1])
+        self.assertIsNone(context['next_cursor'])
+
+        # Fewer orders than a page: one page, no cursor
+        self.login(self.users[10])
+        context = self.client.get(reverse('order_list')).context
+        self.assertEqual(len(context['orders']), 10)
+        self.assertIsNone(context['next_cursor'])
+
+    def test_bad_cursor_shows_the_first_page(self):
+        user = self.users[1000]
+        self.login(user)
+        first = self.client.get(reverse('delivered_items')).context
+        for cursor in ('garbage', '12-ab', '1-2-3', '9' * 40 + '-1', ''):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('delivered_items'), {'after': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['delivered_orders']), list(first['delivered_orders']))
+                self.assertEqual(response.context['next_cursor'], first['next_cursor'])
+
+
+
+class CartSubtotalTests(TestCase):
+    # The cached subtotal is the cart page total: every path that writes cart lines or
+    # product prices must leave it equal to the sum of the lines
+    def setUp(self):
+        self.user = make_customer()
+        self.shoe = make_product('Shoe', price=100)
+        self.boot = make_product('Boot', price=250, category=self.shoe.category)
+        self.client.force_login(self.user)
+
+    def assertSubtotal(self, expected):
+        cart = ShoppingCart.objects.get(user=self.user)
+        self.assertEqual(cart.subtotal, expected)
+        self.assertEqual(cart.get_total_price(), expected)
+        lines = list(ShoppingCart.lines_for(self.user))
+        self.assertEqual(lines[0].cart_total if lines else 0, expected)
+
+    def test_cart_views(self):
+        self.client.get(reverse('add_to_cart', args=[self.shoe.pk]), {'quantity': 2})
+        self.client.get(reverse('add_to_cart', args=[self.boot.pk]))
+        self.assertSubtotal(450)
+        line = CartItem.objects.get(product=self.shoe)
+        self.client.get(reverse('remove_from_cart', args=[line.pk]))
+        self.assertSubtotal(250)
+
+    def test_product_price_change_and_delete(self):
+        cart = ShoppingCart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.shoe, quantity=3)
+        CartItem.objects.create(cart=cart, product=self.boot)
+        ShoppingCart.update_subtotals([cart.pk])
+        self.shoe.price = 120
+        self.shoe.save()
+        self.assertSubtotal(610)
+        self.boot.delete()
+        self.assertSubtotal(360)
+
+    def test_admin_edits(self):
+        staff = Customer.objects.create_superuser(email='admin@example.com', username='admin', password='x')
+        self.client.force_login(staff)
+        cart = ShoppingCart.objects.create(user=self.user)
+        line = CartItem.objects.create(cart=cart, product=self.shoe)
+        CartItem.objects.create(cart=cart, product=self.boot)
+        ShoppingCart.update_subtotals([cart.pk])
+
+        self.client.post(reverse('admin:order_cartitem_change', args=[line.pk]),
+                         {'cart': cart.pk, 'product': self.shoe.pk, 'quantity': 4})
+        self.assertSubtotal(650)
+        self.client.post(reverse('admin:order_cartitem_changelist'),
+                         {'action': 'delete_selected', '_selected_action': [line.pk], 'post': 'yes'})
+        self.assertFalse(CartItem.objects.filter(pk=line.pk).exists())
+        self.assertSubtotal(250)
+
+
+class ExportResponseTests(TestCase):
+    def setUp(self):
+        product = make_product(stock=100)
+        for i in range(3):
+            place_order(make_customer(f'buyer{i}'), product, quantity=i + 1)
+
+    def test_wsgi_streams_a_sync_iterator(self):
+        response = export.response(RequestFactory().get('/'), Order.objects.all(), 'csv')
+        self.assertFalse(response.is_async)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), export.COLUMNS)
+        self.assertEqual(len(lines), 4)
+
+    def test_asgi_streams_an_async_iterator(self):
+        # A sync iterator would be read into memory whole by the ASGI handler
+        async def read(response):
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        for fmt in export.FORMATS:
+            with self.subTest(format=fmt):
+                expected = b''.join(export.response(RequestFactory().get('/'), Order.objects.all(), fmt))
+                response = export.response(AsyncRequestFactory().get('/'), Order.objects.all(), fmt)
+                self.assertTrue(response.is_async)
+                self.assertEqual(async_to_sync(read)(response), expected)
+
+
+class SalesSummaryTests(TestCase):
+    # The summaries against the same sums worked out directly from the orders
+    def setUp(self):
+        self.shoe = make_product('Shoe', price=100, stock=100)
+        self.boot = make_product('Boot', price=250, stock=100)
+        self.customers = 0
+
+    def place(self, days_ago, product, quantity=1):
+        self.customers += 1
+        order = place_order(make_customer(f'customer{self.customers}'), product, quantity)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+        return order
+
+    def expected(self):
+        products, categories, payments = defaultdict(Counter), defaultdict(Counter), defaultdict(Counter)
+        for item in OrderItem.objects.select_related('order__payment', 'product'):
+            day = timezone.localdate(item.order.created_at)
+            prefix = 'canceled_' if item.order.status == Order.CANCELED else ''
+            for sums in (products[day, item.product_id], categories[day, item.product.category_id]):
+                sums[prefix + 'units'] += item.quantity
+                sums[prefix + 'revenue'] += item.quantity * item.price
+        for order in Order.objects.select_related('payment'):
+            prefix = 'canceled_' if order.status == Order.CANCELED else ''
+            sums = payments[timezone.localdate(order.created_at), order.payment.payment_method]
+            sums[prefix + 'orders'] += 1
+            sums[prefix + 'revenue'] += order.total_price
+        return products, categories, payments
+
+    def summaries(self):
+        def rows(model, key, *names):
+            return {(row['day'], row[key]): Counter({name: row[name] for name in names if row[name]})
+                    for row in model.objects.values()}
+
+        sums = ('units', 'revenue', 'canceled_units', 'canceled_revenue')
+        return (rows(DailyProductSales, 'product_id', *sums),
+                rows(DailyCategorySales, 'category_id', *sums),
+                rows(DailyPaymentSales, 'payment_method', 'orders', 'revenue', 'canceled_orders', 'canceled_revenue'))
+
+    def assertSummariesMatch(self):
+        self.assertEqual(self.summaries(), tuple(dict(sums) for sums in self.expected()))
+
+    def test_refresh(self):
+        old = self.place(100, self.shoe, 2)
+        recent = self.place(10, self.boot)
+        self.place(40, self.shoe)
+        self.place(2, self.shoe, 3)
+        written, first = analytics.refresh(batch_days=7)  # no high-water mark yet: every day
+        self.assertEqual(first, timezone.localdate(old.created_at))
+        self.assertSummariesMatch()
+
+        # New orders, a cancellation inside the reopen window, and a leftover row of a day
+        # without orders that the batch covering it deletes
+        self.place(0, self.shoe)
+        newest = self.place(0, self.boot, 2)
+        self.assertTrue(recent.cancel_order())
+        DailyProductSales.objects.create(day=timezone.localdate() - timedelta(days=5), product=self.boot, units=9)
+        high_water = SummaryState.objects.get(name=analytics.STATE).high_water
+        written, first = analytics.refresh(reopen_days=15, batch_days=7)
+        self.assertEqual(first, timezone.localdate(high_water) - timedelta(days=15))
+        self.assertEqual(SummaryState.objects.get(name=analytics.STATE).high_water, newest.created_at)
+        self.assertSummariesMatch()
+
+        # Canceled before the reopen window: left alone until a full refresh
+        self.assertTrue(old.cancel_order())
+        analytics.refresh(reopen_days=15)
+        self.assertNotEqual(self.summaries(), tuple(dict(sums) for sums in self.expected()))
+        call_command('refresh_sales_summary', '--full', stdout=io.StringIO())
+        self.assertSummariesMatch()
+
+    def test_no_orders(self):
+        self.assertEqual(analytics.refresh(), (Counter(), None))
+        self.assertFalse(DailyProductSales.objects.exists())
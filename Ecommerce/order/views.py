@@ -1,14 +1,31 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
+from django.urls import reverse
+from django.db import transaction
+from django.db.models import Prefetch
 from base.forms import *
 from order.models import *
+from order.context_processor import invalidate_cart_count
+from order.pagination import keyset_page
+from order import analytics, guestcart
+from base import pagecache
 
-# Add to Cart
-@login_required
+# Add to Cart (visitors who aren't logged in get a guest cart in their session)
 def add_to_cart(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    quantity = int(request.GET.get('quantity', 1))
+    product = get_object_or_404(Product, pk=pk, is_active=True)
+    try:
+        quantity = int(request.GET.get('quantity', 1))
+    except ValueError:
+        quantity = 0
+    if quantity < 1:
+        messages.error(request, "Please choose a quantity of at least 1.")
+        return redirect('product_detail', pk=product.pk)
+    if not request.user.is_authenticated:
+        return _add_to_guest_cart(request, product, quantity)
+
     cart, created = ShoppingCart.objects.get_or_create(user=request.user)
     cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
 
@@ -18,6 +35,9 @@ def add_to_cart(request, pk):
         cart_item.quantity += quantity
 
     cart_item.save()
+    ShoppingCart.update_subtotals([cart.pk])
+    if created:
+        invalidate_cart_count(request.user.pk)
 
     if request.GET.get('checkout') == 'true':
         return redirect('checkout', item_id=cart_item.id)
@@ -26,88 +46,84 @@ def add_to_cart(request, pk):
     return redirect('view_cart')
 
 
-# Checkout View
+def _add_to_guest_cart(request, product, quantity):
+    try:
+        guestcart.add(request.session, product.pk, quantity)
+    except guestcart.GuestCartFull:
+        messages.error(request, "Your cart is full. Log in to add more items.")
+        return redirect('view_cart')
+
+    if request.GET.get('checkout') == 'true':
+        # Checking out needs an account; the guest cart is merged into it at login
+        return redirect_to_login(reverse('view_cart'))
+
+    messages.success(request, "Your order has been added successfully to your Cart!")
+    return redirect('view_cart')
+
+
+# Payment choices on the checkout form -> (Payment.payment_method, Payment.payment_status)
+PAYMENT_METHODS = {
+    'COD': (Payment.CASH_ON_DELIVERY, Payment.PENDING),
+    'PAYPAL': (Payment.PAYPAL, Payment.COMPLETED),
+    'PAYMAYA': (Payment.PAYMAYA, Payment.COMPLETED),
+    'GCASH': (Payment.GCASH, Payment.COMPLETED),
+}
+
+
+# Checkout View (single cart item)
 @login_required
 def checkout(request,item_id):
-    try:
-        cart = ShoppingCart.objects.get(user=request.user)
-    except ShoppingCart.DoesNotExist:
+    cart_items = CartItem.objects.filter(id=item_id, cart__user=request.user)
+    return _checkout(request, cart_items)
+
+
+# Checkout the whole cart as one order
+@login_required
+def checkout_cart(request):
+    cart_items = CartItem.objects.filter(cart__user=request.user)
+    return _checkout(request, cart_items)
+
+
+def _checkout(request, cart_items):
+    items = list(cart_items.select_related('product'))
+    if not items:
         return redirect('view_cart')
 
-    cart_items = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    total_price = cart_items.total_price()
+    total_price = sum(item.total_price() for item in items)
     user_address = Address.objects.filter(user=request.user).first()
-    username = Customer.objects.get(id=request.user.id)
+    username = request.user
 
     if request.method == 'POST':
         address_form = AddressForm(request.POST)
         form = EditProfileForm(request.POST, request.FILES, instance=username)
         payment_method = request.POST.get('payment_method')   # Get payment method from form
 
-        if not payment_method:
-            return redirect('checkout', item_id=item_id)
-
-        if address_form.is_valid() and payment_method and form.is_valid():
-            address = address_form.save(commit=False)
-            user = form.save(commit=False)
-            if user_address:
-                address.id = user_address.id
-                user.id = username.id
-            address.user = request.user
-            user.user = request.user
-            address.save()
-            user.save()
-
-
-            shipping_address = f"{address.street}, {address.purok}, {address.city}, (Landmark: {address.landmark})"
-
-            # Create the order
-            order = Order.objects.create(
-                user=request.user,
-                status=Order.PENDING,
-                total_price=total_price,
-                shipping_address=shipping_address,
-            )
-
-            # Add items to the order
-            
-            OrderItem.objects.create(
-                order=order,
-                product=cart_items.product,
-                quantity=cart_items.quantity,
-                price=cart_items.product.price,
-            )
-
-            # Handle payment
-            if payment_method == 'COD':
-                Payment.objects.create(
-                    order=order,
-                    payment_method=Payment.CASH_ON_DELIVERY,
-                    payment_status=Payment.PENDING,
-                )
-            elif payment_method == 'GCASH':
-                Payment.objects.create(
-                    order=order,
-                    payment_method=Payment.GCASH,
-                    payment_status=Payment.COMPLETED,
-                )
-            elif payment_method == 'PAYPAL':
-                Payment.objects.create(
-                    order=order,
-                    payment_method=Payment.PAYPAL,
-                    payment_status=Payment.COMPLETED,
-                )
-            elif payment_method == 'PAYMAYA':
-                Payment.objects.create(
-                    order=order,
-                    payment_method=Payment.PAYMAYA,
-                    payment_status=Payment.COMPLETED,
-                )
-
-            # Set a random delivery date
-            order.set_random_delivery_date()
-            # Clear the cart
-            cart_items.delete()
+        if payment_method not in PAYMENT_METHODS:
+            return redirect(request.path)
+
+        if address_form.is_valid() and form.is_valid():
+            try:
+                with transaction.atomic():
+                    address = address_form.save(commit=False)
+                    if user_address:
+                        address.id = user_address.id
+                    address.user = request.user
+                    address.save()
+                    form.save()
+
+                    shipping_address = f"{address.street}, {address.city}, {address.postal}"
+                    method, status = PAYMENT_METHODS[payment_method]
+
+                    # Create the order with all its items, payment and shipping
+                    order = Order.create_from_cart(request.user, cart_items, shipping_address, method, status)
+            except InsufficientStock as error:
+                names = ', '.join(item.product.name for item in items if item.product_id in error.product_ids)
+                messages.error(request, f"Sorry, there is not enough stock left for: {names}")
+                return redirect('view_cart')
+
+            invalidate_cart_count(request.user.pk)
+            if order is None:
+                return redirect('view_cart')
             return redirect('order_summary', order_id=order.id)
 
     else:
@@ -115,11 +131,11 @@ def checkout(request,item_id):
         form = EditProfileForm(instance=username)
 
     return render(request, 'order/checkout.html', {
-        'cart_items': cart_items,
+        'cart_items': items,
         'total_price': total_price,
         'address_form': address_form,
         'form': form,
-        'payment_methods': ['COD', 'PAYPAL', 'PAYMAYA', 'GCASH'],
+        'payment_methods': list(PAYMENT_METHODS),
     })
 
 
@@ -141,43 +157,86 @@ def order_summary(request, order_id):
     return render(request, 'order/order_summary.html', {'order': order})
 
 
-@login_required
 def view_cart(request):
-    try:
-        cart = ShoppingCart.objects.get(user=request.user)  # Get the user's cart
-        cart_items = CartItem.objects.filter(cart=cart)  # Get items in the cart
-        total_price = cart.get_total_price()  # Get total price using the method
-    except ShoppingCart.DoesNotExist:
-        cart_items = []
-        total_price = 0
+    if not request.user.is_authenticated:
+        cart_items = guestcart.lines(request.session)
+        return render(request, 'order/view_cart.html', {
+            'cart_items': cart_items,
+            'total_price': sum(item.line_total for item in cart_items),
+            'guest': True,
+        })
+
+    # One query for the lines, their totals and the cart total, however long the cart is
+    cart_items = list(ShoppingCart.lines_for(request.user))
+    total_price = cart_items[0].cart_total if cart_items else 0
 
     return render(request, 'order/view_cart.html', {
         'cart_items': cart_items,
         'total_price': total_price,
     })
 
+async def aview_cart(request):
+    user = await request.auser()
+
+    async def context():
+        if not user.is_authenticated:
+            cart_items = await guestcart.alines(request.session)
+            return {
+                'cart_items': cart_items,
+                'total_price': sum(item.line_total for item in cart_items),
+                'guest': True,
+            }
+        cart_items = [line async for line in ShoppingCart.lines_for(user)]
+        return {
+            'cart_items': cart_items,
+            'total_price': cart_items[0].cart_total if cart_items else 0,
+        }
+
+    return await pagecache.arender(request, 'order/view_cart.html', context)
+
+def remove_from_guest_cart(request, product_id):
+    guestcart.remove(request.session, product_id)
+    messages.error(request, "Your order has been remove successfully to your Cart!")
+    return redirect('view_cart')
+
 @login_required
 def remove_from_cart(request, cart_item_id):
-    cart_item = get_object_or_404(CartItem, id=cart_item_id)
+    cart_item = get_object_or_404(CartItem, id=cart_item_id, cart__user=request.user)
     cart_item.delete()  # Remove the cart item
+    ShoppingCart.update_subtotals([cart_item.cart_id])
+    invalidate_cart_count(request.user.pk)
     remove = messages.error(request, "Your order has been remove successfully to your Cart!")
     return redirect('view_cart')
 
 @login_required
 def order_status(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-
-    # Update the shipping status based on the delivery date
-    if hasattr(order, 'shipping'):
-        order.shipping.update_shipping_status()
+    # Read only: shipping statuses are moved forward by the sweep_shipping command
+    order = get_object_or_404(Order.objects.select_related('shipping', 'payment'), id=order_id, user=request.user)
 
     return render(request, 'order/order_status.html', {
         'order': order,
-        'shipping': order.shipping,
-        'order_items': order.items.all(),
+        'shipping': getattr(order, 'shipping', None),
+        # Products joined: the template shows each item's name and image
+        'order_items': order.items.select_related('product'),
         'shipping_address': order.shipping_address,
     })
 
+@login_required
+async def aorder_status(request, order_id):
+    user = await request.auser()
+
+    async def context():
+        order = await aget_object_or_404(Order.objects.select_related('shipping', 'payment'), id=order_id, user=user)
+        return {
+            'order': order,
+            'shipping': getattr(order, 'shipping', None),
+            # Products joined: the template shows each item's name and image
+            'order_items': [item async for item in order.items.select_related('product')],
+            'shipping_address': order.shipping_address,
+        }
+
+    return await pagecache.arender(request, 'order/order_status.html', context)
+
 @login_required
 def create_shipping(request, order_id):
     # Get the order by ID or return 404 if not found
@@ -201,16 +260,24 @@ def create_shipping(request, order_id):
 # View the Ordered List / Shipping Products
 @login_required
 def order_list(request):
-    # Get all orders for the logged-in user
-    orders = Order.objects.filter(user=request.user).exclude(status=Order.DELIVERED and Order.CANCELED).order_by('-created_at')
-    product = Product.objects.filter(name__in=orders)
+    # Get the open orders for the logged-in user, one page at a time
+    orders = Order.objects.filter(user=request.user).exclude(status__in=[Order.DELIVERED, Order.CANCELED])
+    orders, next_cursor = keyset_page(orders, request.GET.get('after'))
     # Pass the orders to the template
     return render(request, 'order/order_list.html', {
         'orders': orders,
-        'product':product,
+        'next_cursor': next_cursor,
     })
 
 
+def _order_history(user, status):
+    # Shipping joined and items with their products prefetched: the number of
+    # queries doesn't depend on how many orders are on the page
+    return (Order.objects.filter(status=status, user=user)
+            .select_related('shipping')
+            .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product'))))
+
+
 # Check if already Delivered to mark as Delivered and move to Delivered Items
 def mark_order_as_canceled(request, order_id):
     # Get the order object
@@ -233,10 +300,15 @@ def mark_order_as_delivered(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
     # Mark as delivered and move items to DeliveredItem
     if order.status != Order.DELIVERED:
-        order.status = Order.DELIVERED
-        order.save()
-        # Move items to delivered items
-        order.move_to_delivered_items()
+        try:
+            with transaction.atomic():
+                order.status = Order.DELIVERED
+                order.save()
+                # Move items to delivered items
+                order.move_to_delivered_items()
+        except (InvalidTransition, ConcurrentUpdateError):
+            messages.error(request, f"Order #{order.id} can no longer be marked as delivered.")
+            return redirect('delivered_items')
 
         messages.success(request, f"Order #{order.id} marked as delivered.")
     else:
@@ -247,14 +319,33 @@ def mark_order_as_delivered(request, order_id):
 # Delivered Items
 @login_required
 def delivered_items(request):
-    delivered_orders = Order.objects.filter(status=Order.DELIVERED, user=request.user)
+    delivered_orders, next_cursor = keyset_page(_order_history(request.user, Order.DELIVERED), request.GET.get('after'))
     return render(request, 'order/delivered_items.html', {
         'delivered_orders': delivered_orders,
+        'next_cursor': next_cursor,
     })
 
 @login_required
 def canceled_items(request):
-    canceled_orders = Order.objects.filter(status=Order.CANCELED, user=request.user)
+    canceled_orders, next_cursor = keyset_page(_order_history(request.user, Order.CANCELED), request.GET.get('after'))
     return render(request, 'order/canceled_items.html', {
         'canceled_orders': canceled_orders,
-    })
\ No newline at end of file
+        'next_cursor': next_cursor,
+    })
+
+
+# Sales Dashboard (staff only): reads the daily summaries, never the orders themselves
+DASHBOARD_RANGES = (7, 30, 90, 365)
+
+@staff_member_required
+def sales_dashboard(request):
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in DASHBOARD_RANGES:
+        days = 30
+
+    context = analytics.dashboard(days)
+    context.update(days=days, ranges=DASHBOARD_RANGES)
+    return render(request, 'order/sales_dashboard.html', context)